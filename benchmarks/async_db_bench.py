@@ -0,0 +1,178 @@
+"""Compare concurrent /public-products traffic on the sync and async sessions.
+
+The old handler ran synchronous queries inside ``async def``, so every query
+held the event loop. The new one awaits an ``AsyncSession``. Both are driven
+concurrently over httpx's ASGI transport with the catalog cache disabled, and
+a cheap probe request measures how long the loop is kept busy.
+
+SQLite answers in microseconds, so ``--latency-ms`` adds a sleep to every
+statement in the thread that runs it, standing in for the network round
+trip to Postgres. With the sync session that thread is the event loop's:
+
+    python benchmarks/async_db_bench.py [--requests 400] [--concurrency 12] [--latency-ms 5]
+
+Keep ``--concurrency`` below DB_POOL_SIZE + DB_MAX_OVERFLOW: past that the
+sync handler blocks the loop waiting for a connection that only another
+request on the same loop can return, and stalls until DB_POOL_TIMEOUT.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+# Every request must reach the database
+os.environ["CATALOG_CACHE_SIZE"] = "0"
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+
+import httpx  # noqa: E402
+from fastapi import Depends  # noqa: E402
+from sqlalchemy import event, func, insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+from models import Like, Product  # noqa: E402
+
+
+@main.app.get("/bench/legacy-public-products", include_in_schema=False)
+async def legacy_public_products(db: Session = Depends(database.get_db)):
+    """The pre-async handler: blocking queries inside ``async def``."""
+    like_counts = (
+        db.query(Like.product_id, func.sum(Like.like).label("likes"))
+        .group_by(Like.product_id)
+        .subquery()
+    )
+    rows = (
+        db.query(Product, func.coalesce(like_counts.c.likes, 0))
+        .outerjoin(like_counts, like_counts.c.product_id == Product.id)
+        .filter(Product.is_validated == True)
+        .order_by(Product.id)
+        .limit(main.CATALOG_PAGE_SIZE + 1)
+        .all()
+    )
+    return [{"id": p.id, "name": p.name, "likes": int(likes)} for p, likes in rows]
+
+
+@main.app.get("/bench/probe", include_in_schema=False)
+async def probe():
+    return {}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def drive(path, args):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get(path)  # warm up the pool
+        remaining = iter(range(args.requests))
+        latencies, probes = [], []
+
+        async def worker():
+            for _ in remaining:
+                start = time.perf_counter()
+                r = await client.get(path)
+                r.raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        async def prober(done):
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/bench/probe")
+                probes.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.005)
+
+        async def workers_then_stop(done):
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            done.set()
+
+        done = asyncio.Event()
+        start = time.perf_counter()
+        await asyncio.gather(workers_then_stop(done), prober(done))
+        elapsed = time.perf_counter() - start
+    await database.dispose_async_engine()
+    return latencies, probes, elapsed
+
+
+def add_latency(seconds):
+    """Sleep before every statement on both engines' connections."""
+
+    def trace(_statement):
+        time.sleep(seconds)
+
+    @event.listens_for(database.engine, "connect")
+    def _sync(dbapi_connection, _):
+        dbapi_connection.set_trace_callback(trace)
+
+    @event.listens_for(database.async_engine.sync_engine, "connect")
+    def _async(dbapi_connection, _):
+        # Runs on aiosqlite's connection thread, as asyncpg waits off the loop
+        dbapi_connection.run_async(lambda conn: conn.set_trace_callback(trace))
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--likes", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    main.apply_migrations()
+
+    db = database.SessionLocal()
+    db.add_all(
+        Product(
+            name=f"Product {i}",
+            description="",
+            price="10",
+            image_url="",
+            is_validated=True,
+            delivery_range_km=5,
+            phone_number=f"bench-{i}",
+        )
+        for i in range(500)
+    )
+    db.commit()
+    db.execute(
+        insert(Like),
+        [{"product_id": i % 500 + 1, "like": 1} for i in range(args.likes)],
+    )
+    db.commit()
+    db.close()
+
+    # Create the async engine so the latency hook can attach to it
+    database.get_async_sessionmaker()
+    database.engine.dispose()
+    if args.latency_ms:
+        add_latency(args.latency_ms / 1000)
+
+    print(
+        f"{args.requests} requests, {args.concurrency} concurrent, {args.likes} like rows, "
+        f"{args.latency_ms} ms per statement"
+    )
+    for label, path in (
+        ("sync", "/bench/legacy-public-products"),
+        ("async", "/public-products"),
+    ):
+        latencies, probes, elapsed = asyncio.run(drive(path, args))
+        print(
+            f"{label:>6}: {args.requests / elapsed:7.1f} req/s, "
+            f"p50 {percentile(latencies, 50):7.1f} ms, p99 {percentile(latencies, 99):7.1f} ms, "
+            f"probe p99 {percentile(probes, 99):7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    run()
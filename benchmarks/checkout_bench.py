@@ -0,0 +1,118 @@
+"""Compare the old per-line checkout with the batched one on a 50-line cart.
+
+Runs against a throwaway SQLite database so it needs no network access:
+
+    python benchmarks/checkout_bench.py [--lines 50] [--runs 200]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from sqlalchemy import create_engine, event  # noqa: E402
+
+import database  # noqa: E402
+
+# Point the app at a local SQLite file
+_db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+database.engine = create_engine(f"sqlite:///{_db_file}", connect_args={"check_same_thread": False})
+database.SessionLocal.configure(bind=database.engine)
+
+import main  # noqa: E402
+from models import Order, OrderItem, Product  # noqa: E402
+
+
+def legacy_checkout(request, db):
+    """The pre-batching checkout: one product query and one INSERT per line."""
+    order = Order(
+        buyer=request.items[0].product_id,
+        phone_number=request.phone_number,
+        status="Pending",
+        address=request.address,
+    )
+    db.add(order)
+    db.flush()
+    db.flush()
+    for item in request.items:
+        product = db.query(Product).filter(Product.id == item.product_id).first()
+        if not product or not product.is_validated:
+            raise RuntimeError("bad product")
+        db.add(OrderItem(order_id=order.id, product_id=item.product_id, quantity=item.quantity))
+    db.commit()
+
+
+def batched_checkout(request, db):
+    asyncio.run(main.checkout(request=request, db=db))
+
+
+def measure(fn, request, runs):
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(database.engine, "before_cursor_execute", count)
+    start = time.perf_counter()
+    for _ in range(runs):
+        db = database.SessionLocal()
+        try:
+            fn(request, db)
+        finally:
+            db.close()
+    elapsed = time.perf_counter() - start
+    event.remove(database.engine, "before_cursor_execute", count)
+    return elapsed / runs * 1000, statements / runs
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    main.apply_migrations()
+
+    db = database.SessionLocal()
+    db.add_all(
+        Product(
+            name=f"Product {i}",
+            description="",
+            price="10",
+            image_url="",
+            is_validated=True,
+            delivery_range_km=5,
+            phone_number=f"bench-{i}",
+        )
+        for i in range(args.lines)
+    )
+    db.commit()
+    ids = [p.id for p in db.query(Product).all()]
+    db.close()
+
+    request = main.CheckoutRequest(
+        address="Bench Street",
+        phone_number="9800000000",
+        items=[main.CartItem(product_id=pid, quantity=1) for pid in ids],
+    )
+
+    # Silence the per-request payload print in checkout
+    devnull = open(os.devnull, "w")
+    for label, fn in (("before", legacy_checkout), ("after", batched_checkout)):
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            ms, statements = measure(fn, request, args.runs)
+        finally:
+            sys.stdout = stdout
+        print(f"{label:>6}: {ms:7.2f} ms/checkout, {statements:5.1f} statements/checkout")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,103 @@
+"""Check that the expiry job removes expired products that were ordered or liked.
+
+``order_items.product_id`` and ``like.product_id`` reference
+``products.id``, so deleting an ordered or liked product fails on a
+database that enforces foreign keys and the job used to retry the same
+failing batch every run. This seeds expired products, orders one and likes
+another, and runs ``delete_expired_products`` with foreign keys enforced
+(SQLite turns them on per connection). Exits non-zero on failure:
+
+    python benchmarks/expiry_cleanup.py
+    DATABASE_URL=postgresql://... python benchmarks/expiry_cleanup.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+os.environ["NOTIFY_TRANSPORT"] = "fake"
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "expiry.db")
+)
+
+from sqlalchemy import event  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+from models import Like, Order, OrderItem, Product  # noqa: E402
+
+if database.engine.dialect.name == "sqlite":
+    @event.listens_for(database.engine, "connect")
+    def _enforce_foreign_keys(dbapi_connection, _):
+        dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+
+def product(name, expires_at):
+    return Product(
+        name=name,
+        description="",
+        price="10",
+        image_url="",
+        is_validated=True,
+        delivery_range_km=5,
+        phone_number=f"expiry-{name}",
+        expires_at=expires_at,
+    )
+
+
+def run():
+    main.apply_migrations()
+    now = datetime.utcnow()
+    db = database.SessionLocal()
+    ordered = product("ordered", now - timedelta(days=1))
+    liked = product("liked", now - timedelta(days=1))
+    unordered = product("unordered", now - timedelta(days=1))
+    fresh = product("fresh", now + timedelta(days=1))
+    db.add_all([ordered, liked, unordered, fresh])
+    db.flush()
+    db.add(Like(product_id=liked.id, like=3))
+    order = Order(buyer="buyer", phone_number="9800000000", address="Street", status="Pending")
+    order.items.append(OrderItem(product_id=ordered.id, quantity=1))
+    db.add(order)
+    db.commit()
+    ids = {p.phone_number: p.id for p in (ordered, liked, unordered, fresh)}
+    order_id = order.id
+    db.close()
+
+    deleted = main.delete_expired_products()
+
+    db = database.SessionLocal()
+    remaining = {pid for (pid,) in db.query(Product.id)}
+    likes_left = db.query(Like).count()
+    order = db.get(Order, order_id)
+    item_names = main._serialize_order(order)["items"]
+    db.close()
+
+    failures = []
+    if deleted != 3:
+        failures.append(f"deleted {deleted} products, expected 3")
+    if any(ids[f"expiry-{name}"] in remaining for name in ("ordered", "liked", "unordered")):
+        failures.append("an expired product was left behind")
+    if likes_left:
+        failures.append(f"{likes_left} like row(s) of deleted products were left")
+    if ids["expiry-fresh"] not in remaining:
+        failures.append("a product that has not expired was deleted")
+    if [i["name"] for i in item_names] != ["[deleted]"]:
+        failures.append(f"the order lost its item: {item_names}")
+    if main.cleanup_stats["failures"]:
+        failures.append(f"{main.cleanup_stats['failures']} batch(es) failed")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("Expired products removed; their order items were kept")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,349 @@
+"""Load-test the main endpoints in-process against a seeded database.
+
+Seeds thousands of sellers (user, shop and product each), buyers, orders
+with their items, and likes, then drives the real app over httpx's ASGI
+transport with a fixed number of concurrent clients per endpoint. Reports
+throughput, p50/p95/p99 latency and SQL statements per request (from the
+``Server-Timing`` header), and saves everything as JSON:
+
+    python benchmarks/load_bench.py [--sellers 2000] [--requests 300] [--compare old.json]
+    DATABASE_URL=postgresql://.../bench python benchmarks/load_bench.py
+
+Without ``DATABASE_URL`` a throwaway SQLite file is used. A database that
+already has products is reused as it is, so point Postgres runs at a
+scratch database; it is seeded on the first run only, which keeps repeated
+runs on the same data. ``--seed`` fixes every random choice. ``/token`` is
+bound by bcrypt and the admin listings return every row, so they get
+their own, smaller request counts.
+
+Keep ``--concurrency`` below DB_POOL_SIZE + DB_MAX_OVERFLOW: ``/checkout``
+uses a blocking session inside ``async def`` and stalls the loop when it
+has to wait for a connection.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+os.environ["NOTIFY_TRANSPORT"] = "fake"
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "load.db")
+)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+PASSWORD = "bench-password"
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sellers", type=int, default=2000)
+    parser.add_argument("--buyers", type=int, default=3000)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--likes", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=300,
+                        help="requests per endpoint")
+    parser.add_argument("--token-requests", type=int, default=40)
+    parser.add_argument("--admin-requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="disable the catalog and principal caches")
+    parser.add_argument("--only", action="append", metavar="NAME",
+                        help="run only this scenario (repeatable)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", metavar="FILE", help="earlier result file to diff against")
+    return parser.parse_args()
+
+
+def seller_phone(i):
+    return f"97{i:08d}"
+
+
+def buyer_name(i, domain):
+    return f"buyer{i}@{domain}"
+
+
+def seed(db, args, rng, domain):
+    """Insert the benchmark data set with bulk INSERTs; return the row counts."""
+    from sqlalchemy import insert
+
+    import passwords
+    from models import Like, Order, OrderItem, Product, Shop, UserModel
+
+    hashed = passwords.pwd_context.hash(PASSWORD)
+    db.execute(insert(UserModel), [
+        {
+            "username": f"seller{i}@{domain}",
+            "hashed_password": hashed,
+            "role": "buyer,seller",
+            "shop_name": f"Shop {i}",
+            "phone_number": seller_phone(i),
+        }
+        for i in range(args.sellers)
+    ] + [
+        {
+            "username": buyer_name(i, domain),
+            "hashed_password": hashed,
+            "role": "buyer",
+            "phone_number": f"96{i:08d}",
+        }
+        for i in range(args.buyers)
+    ])
+    db.execute(insert(Shop), [
+        {"name": f"Shop {i}", "address": f"{i} Market Road", "phone_number": seller_phone(i)}
+        for i in range(args.sellers)
+    ])
+    # products.phone_number is unique, so each seller lists a single product
+    db.execute(insert(Product), [
+        {
+            "name": f"Product {i}",
+            "description": "Fresh from the farm",
+            "price": str(rng.randint(10, 500)),
+            "image_url": f"/static/uploads/p{i}.webp",
+            "is_validated": rng.random() < 0.9,
+            "delivery_range_km": rng.randint(1, 20),
+            "phone_number": seller_phone(i),
+            "expires_at": datetime.utcnow() + timedelta(days=30),
+        }
+        for i in range(args.sellers)
+    ])
+    db.execute(insert(Like), [
+        {"product_id": rng.randint(1, args.sellers), "like": 1} for _ in range(args.likes)
+    ])
+    now = datetime.utcnow()
+    db.execute(insert(Order), [
+        {
+            "buyer": buyer_name(i % args.buyers, domain),
+            "phone_number": f"96{i % args.buyers:08d}",
+            "address": "Bench Street",
+            "status": rng.choice(["Pending", "Shipped", "Delivered"]),
+            "timestamp": now - timedelta(minutes=i),
+        }
+        for i in range(args.orders)
+    ])
+    items = [
+        {"order_id": order_id, "product_id": rng.randint(1, args.sellers), "quantity": rng.randint(1, 3)}
+        for order_id in range(1, args.orders + 1)
+        for _ in range(rng.randint(1, 4))
+    ]
+    db.execute(insert(OrderItem), items)
+    db.commit()
+    return {
+        "users": args.sellers + args.buyers,
+        "shops": args.sellers,
+        "products": args.sellers,
+        "likes": args.likes,
+        "orders": args.orders,
+        "order_items": len(items),
+    }
+
+
+def existing_counts(db):
+    from sqlalchemy import func, select
+
+    from models import Like, Order, OrderItem, Product, Shop, UserModel
+
+    tables = {
+        "users": UserModel, "shops": Shop, "products": Product,
+        "likes": Like, "orders": Order, "order_items": OrderItem,
+    }
+    return {name: db.scalar(select(func.count()).select_from(model)) for name, model in tables.items()}
+
+
+def scenarios(args, rng, validated_ids, tokens):
+    """Endpoints to drive, as (name, request count, request factory)."""
+    buyers = list(tokens.items())
+
+    def checkout():
+        items = [
+            {"product_id": pid, "quantity": rng.randint(1, 3)}
+            for pid in rng.sample(validated_ids, rng.randint(1, 5))
+        ]
+        body = {"address": "Bench Street", "phone_number": "9600000000", "items": items}
+        return "POST", "/checkout", {"json": body}
+
+    def buyer_orders():
+        _, token = rng.choice(buyers)
+        return "GET", "/buyer/orders", {"headers": {"Authorization": f"Bearer {token}"}}
+
+    def login():
+        username, _ = rng.choice(buyers)
+        return "POST", "/token", {"data": {"username": username, "password": PASSWORD}}
+
+    def public_products():
+        cursor = rng.choice([None, rng.randint(1, max(1, args.sellers - 50))])
+        return "GET", "/public-products" + (f"?cursor={cursor}" if cursor else ""), {}
+
+    return [
+        ("public-products", args.requests, public_products),
+        ("checkout", args.requests, checkout),
+        ("buyer-orders", args.requests, buyer_orders),
+        ("admin-orders", args.admin_requests, lambda: ("GET", "/admin/orders", {})),
+        ("admin-sellers-details", args.admin_requests,
+         lambda: ("GET", "/admin/sellers/details", {})),
+        ("token", args.token_requests, login),
+    ]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def drive(app, count, make_request, concurrency):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    latencies, queries, errors = [], [], {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        remaining = iter(range(count))
+
+        async def worker():
+            for _ in remaining:
+                method, path, kwargs = make_request()
+                start = time.perf_counter()
+                response = await client.request(method, path, **kwargs)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 400:
+                    errors[response.status_code] = errors.get(response.status_code, 0) + 1
+                match = _QUERIES.search(response.headers.get("server-timing", ""))
+                if match:
+                    queries.append(int(match.group(1)))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": count,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+        "queries_per_request": round(sum(queries) / len(queries), 1) if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nchange against {baseline_path} (negative latency is better)")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        deltas = [
+            f"{key} {100 * (result[key] - old[key]) / old[key]:+6.1f}%"
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+            if old.get(key)
+        ]
+        print(f"{name:>22}: " + ", ".join(deltas))
+
+
+def run():
+    args = parse_args()
+    if args.no_cache:
+        os.environ["CATALOG_CACHE_SIZE"] = "0"
+        os.environ["PRINCIPAL_CACHE_SIZE"] = "0"
+
+    from fastapi.testclient import TestClient
+
+    import database
+    import main
+    from models import Product
+
+    # Keep request logs out of the report; every admin listing is a slow request
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("instrumentation").setLevel(logging.ERROR)
+    rng = random.Random(args.seed)
+    main.apply_migrations()
+    db = database.SessionLocal()
+    try:
+        if db.query(Product.id).first() is None:
+            print("Seeding database...")
+            counts = seed(db, args, rng, main.USERNAME_DOMAIN)
+        else:
+            counts = existing_counts(db)
+        validated_ids = [pid for (pid,) in db.query(Product.id).filter(Product.is_validated == True)]
+    finally:
+        db.close()
+    print(", ".join(f"{n} {name}" for name, n in counts.items()))
+
+    # Log a handful of buyers in up front for /buyer/orders
+    with TestClient(main.app) as client:
+        tokens = {}
+        for i in range(min(20, args.buyers)):
+            username = buyer_name(i, main.USERNAME_DOMAIN)
+            response = client.post("/token", data={"username": username, "password": PASSWORD})
+            response.raise_for_status()
+            tokens[username] = response.json()["access_token"]
+
+    results = {}
+    print(f"{args.concurrency} concurrent clients, {database.engine.dialect.name}")
+    for name, count, make_request in scenarios(args, rng, validated_ids, tokens):
+        if args.only and name not in args.only:
+            continue
+        # checkout prints every payload it receives
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = asyncio.run(drive(main.app, count, make_request, args.concurrency))
+            asyncio.run(database.dispose_async_engine())
+        results[name] = result
+        errors = f", errors {result['errors']}" if result["errors"] else ""
+        print(
+            f"{name:>22}: {result['throughput_rps']:7.1f} req/s, p50 {result['p50_ms']:8.1f} ms, "
+            f"p95 {result['p95_ms']:8.1f} ms, p99 {result['p99_ms']:8.1f} ms, "
+            f"{result['queries_per_request']} queries/req{errors}"
+        )
+
+    report = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "database": database.engine.dialect.name,
+        "config": vars(args),
+        "rows": counts,
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.utcnow().strftime("load-%Y%m%dT%H%M%S.json")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    run()
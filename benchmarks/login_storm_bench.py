@@ -0,0 +1,135 @@
+"""Measure catalog latency while a storm of logins hits /token.
+
+Drives the app in-process over httpx's ASGI transport, so logins and catalog
+reads share one event loop just as they do under uvicorn. Compares bcrypt
+run inline on the loop with bcrypt on the bounded hashing pool:
+
+    python benchmarks/login_storm_bench.py [--logins 200] [--concurrency 16]
+
+Set BCRYPT_ROUNDS and HASH_WORKERS to try other cost factors and pool sizes.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import httpx  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+import database  # noqa: E402
+
+# Point the app at a local SQLite file
+_db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+database.engine = create_engine(f"sqlite:///{_db_file}", connect_args={"check_same_thread": False})
+database.SessionLocal.configure(bind=database.engine)
+
+import main  # noqa: E402
+import passwords  # noqa: E402
+from models import Product, UserModel  # noqa: E402
+
+PASSWORD = "bench-password"
+
+
+async def _inline(fn, *args):
+    """The pre-pool behaviour: bcrypt runs on the event loop thread."""
+    return fn(*args)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def storm(args):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        logins = iter(range(args.logins))
+
+        async def login_worker():
+            for _ in logins:
+                r = await client.post("/token", data={"username": "bench@kinbech", "password": PASSWORD})
+                r.raise_for_status()
+
+        async def catalog_reader(latencies, done):
+            # Reads are scheduled every 10 ms for as long as the storm lasts and
+            # timed from their scheduled start, so a blocked loop shows up as latency
+            scheduled = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                r = await client.get("/public-products")
+                r.raise_for_status()
+                latencies.append((time.perf_counter() - scheduled) * 1000)
+                scheduled += 0.010
+
+        async def logins_then_stop(done):
+            await asyncio.gather(*(login_worker() for _ in range(args.concurrency)))
+            done.set()
+
+        latencies = []
+        done = asyncio.Event()
+        start = time.perf_counter()
+        await asyncio.gather(catalog_reader(latencies, done), logins_then_stop(done))
+        elapsed = time.perf_counter() - start
+    # The catalog reads used the async engine; its connections belong to this loop
+    await database.dispose_async_engine()
+    return latencies, elapsed
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    main.apply_migrations()
+
+    db = database.SessionLocal()
+    db.add(
+        UserModel(
+            username="bench@kinbech",
+            hashed_password=passwords.pwd_context.hash(PASSWORD),
+            role="buyer",
+        )
+    )
+    db.add_all(
+        Product(
+            name=f"Product {i}",
+            description="",
+            price="10",
+            image_url="",
+            is_validated=True,
+            delivery_range_km=5,
+            phone_number=f"bench-{i}",
+        )
+        for i in range(100)
+    )
+    db.commit()
+    db.close()
+
+    print(
+        f"bcrypt rounds={passwords.BCRYPT_ROUNDS}, workers={passwords.HASH_WORKERS}, "
+        f"{args.logins} logins, {args.concurrency} concurrent"
+    )
+    pooled = passwords._run
+    for label, runner in (("inline", _inline), ("pool", pooled)):
+        passwords._run = runner
+        main.catalog_cache.invalidate()
+        latencies, elapsed = asyncio.run(storm(args))
+        print(
+            f"{label:>6}: catalog p50 {percentile(latencies, 50):7.1f} ms, "
+            f"p99 {percentile(latencies, 99):7.1f} ms, max {max(latencies):7.1f} ms, "
+            f"{len(latencies)} reads, storm took {elapsed:5.1f} s"
+        )
+    passwords._run = pooled
+    print("pool stats:", passwords.hash_stats.snapshot())
+
+
+if __name__ == "__main__":
+    run()
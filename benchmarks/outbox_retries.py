@@ -0,0 +1,103 @@
+"""Check that failed outbox sends back off exponentially and end up ``failed``.
+
+Queues one message per scenario and calls ``deliver_pending`` at each due
+time with a ``FakeTransport`` that fails a set number of times. After every
+failed attempt, ``attempts`` must go up by one and ``next_attempt_at`` must
+be ``OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1)`` later. The message must
+not be retried before then. A message that recovers is ``sent``, and one
+that keeps failing is ``failed`` after ``OUTBOX_MAX_ATTEMPTS``. Exits
+non-zero on failure:
+
+    python benchmarks/outbox_retries.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+os.environ["NOTIFY_TRANSPORT"] = "fake"
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "outbox.db")
+)
+
+import database  # noqa: E402
+import notifications  # noqa: E402
+from migrations import migrate  # noqa: E402
+from models import OutboxMessage  # noqa: E402
+
+
+def deliver(fail_times):
+    """Send one message until it leaves ``pending``; return it and the failures seen."""
+    transport = notifications.FakeTransport(fail_times=fail_times)
+    notifications.transports[notifications.EMAIL] = transport
+    db = database.SessionLocal()
+    notifications.enqueue(db, notifications.EMAIL, f"retry-{fail_times}@example.com", "body", "subject")
+    db.commit()
+    message_id = db.query(OutboxMessage.id).order_by(OutboxMessage.id.desc()).first()[0]
+    db.close()
+
+    failures = []
+    now = datetime.utcnow()
+    for attempt in range(1, notifications.OUTBOX_MAX_ATTEMPTS + 2):
+        if notifications.deliver_pending(database.SessionLocal, now=now) != 1:
+            failures.append(f"attempt {attempt} was not made when due")
+            break
+        db = database.SessionLocal()
+        message = db.get(OutboxMessage, message_id)
+        db.close()
+        if message.attempts != attempt:
+            failures.append(f"attempts is {message.attempts} after attempt {attempt}")
+        if message.status != "pending":
+            return message, transport, failures
+        expected = timedelta(seconds=notifications.OUTBOX_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        if message.next_attempt_at - now != expected:
+            failures.append(
+                f"retry {attempt} is due after {message.next_attempt_at - now}, expected {expected}"
+            )
+        early = message.next_attempt_at - timedelta(seconds=1)
+        if notifications.deliver_pending(database.SessionLocal, now=early):
+            failures.append(f"retry {attempt} was sent before it was due")
+        now = message.next_attempt_at
+    failures.append("the message never left pending")
+    return message, transport, failures
+
+
+def run():
+    migrate(database.engine)
+    max_attempts = notifications.OUTBOX_MAX_ATTEMPTS
+    failures = []
+
+    message, transport, seen = deliver(fail_times=2)
+    failures += [f"recovering send: {f}" for f in seen]
+    if message.status != "sent" or message.attempts != 3 or len(transport.sent) != 1:
+        failures.append(
+            f"recovering send ended {message.status} after {message.attempts} attempts, expected sent after 3"
+        )
+
+    message, transport, seen = deliver(fail_times=max_attempts + 1)
+    failures += [f"failing send: {f}" for f in seen]
+    if message.status != "failed" or message.attempts != max_attempts:
+        failures.append(
+            f"failing send ended {message.status} after {message.attempts} attempts, "
+            f"expected failed after {max_attempts}"
+        )
+    if not message.last_error:
+        failures.append("failing send kept no last_error")
+    later = message.next_attempt_at + timedelta(days=1)
+    if notifications.deliver_pending(database.SessionLocal, now=later):
+        failures.append("a failed message was retried")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"Retries back off exponentially and stop after {max_attempts} attempts")
+
+
+if __name__ == "__main__":
+    run()
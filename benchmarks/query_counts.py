@@ -0,0 +1,131 @@
+"""Fail if a listing endpoint's query count grows with the data behind it.
+
+Calls each endpoint against a small and a large scratch data set (5 and
+405 sellers, buyers and orders) and compares the number of SQL statements
+per request, read from the ``Server-Timing`` header. Every page should cost
+the same whatever the table sizes; a difference means a query per row
+(N+1) crept back in. The large set stays under 500 orders because
+``selectinload`` splits its IN lists into chunks of 500 keys, so unpaged
+listings legitimately take one more query per 500 rows:
+
+    python benchmarks/query_counts.py
+"""
+
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+# Every read must reach the database, and messages are only recorded
+os.environ["CATALOG_CACHE_SIZE"] = "0"
+os.environ["PRINCIPAL_CACHE_SIZE"] = "0"
+os.environ["NOTIFY_TRANSPORT"] = "fake"
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "counts.db")
+)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+from models import Like, Order, OrderItem, Product, Shop, UserModel  # noqa: E402
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+# Seller and buyer whose listings grow along with everything else
+SELLER_PHONE = "9700000000"
+BUYER_PHONE = "9600000000"
+BUYER = f"buyer{BUYER_PHONE}"
+SELLER = f"seller{SELLER_PHONE}"
+
+# (label, path, user to authenticate as) of each listing to check
+ENDPOINTS = [
+    ("GET /public-products", "/public-products", None),
+    ("GET /buyer/orders", "/buyer/orders", BUYER),
+    ("GET /seller/orders", "/seller/orders", SELLER),
+    ("GET /api/orders/by-phone", f"/api/orders/by-phone/{BUYER_PHONE}", None),
+    ("GET /api/products/by-phone", f"/api/products/by-phone/{SELLER_PHONE}", None),
+    ("GET /admin/orders", "/admin/orders", None),
+    ("GET /admin/sellers/details", "/admin/sellers/details", None),
+]
+
+
+def add_data(db, start, count):
+    """Add ``count`` sellers (shop and product each), buyers, likes and orders.
+
+    Every order belongs to ``BUYER`` and holds one of ``SELLER``'s items next
+    to items from the new sellers, so each listing under test gets longer.
+    """
+    phones = [f"97{i:08d}" for i in range(start, start + count)]
+    db.execute(insert(UserModel), [
+        {"username": f"seller{p}", "role": "buyer,seller", "phone_number": p} for p in phones
+    ] + [
+        {"username": f"buyer96{p[2:]}", "role": "buyer", "phone_number": f"96{p[2:]}"} for p in phones
+    ])
+    db.execute(insert(Shop), [
+        {"name": f"Shop {p}", "address": "Market Road", "phone_number": p} for p in phones
+    ])
+    db.execute(insert(Product), [
+        {
+            "name": f"Product {p}",
+            "description": "",
+            "price": "10",
+            "image_url": "",
+            "is_validated": True,
+            "delivery_range_km": 5,
+            "phone_number": p,
+        }
+        for p in phones
+    ])
+    new_ids = [pid for (pid,) in db.query(Product.id).filter(Product.phone_number.in_(phones))]
+    seller_product = db.query(Product.id).filter(Product.phone_number == SELLER_PHONE).scalar()
+    db.execute(insert(Like), [{"product_id": pid, "like": 1} for pid in new_ids])
+    for pid in new_ids:
+        order = Order(buyer=BUYER, phone_number=BUYER_PHONE, address="Street", status="Pending")
+        order.items = [
+            OrderItem(product_id=seller_product, quantity=1),
+            OrderItem(product_id=pid, quantity=2),
+        ]
+        db.add(order)
+    db.commit()
+
+
+def query_count(client, path, user):
+    headers = {"Authorization": f"Bearer {main.create_access_token({'sub': user})}"} if user else {}
+    response = client.get(path, headers=headers)
+    response.raise_for_status()
+    return int(_QUERIES.search(response.headers["server-timing"]).group(1))
+
+
+def run():
+    main.apply_migrations()
+    client = TestClient(main.app)
+    db = database.SessionLocal()
+
+    add_data(db, 0, 5)
+    small = {label: query_count(client, path, user) for label, path, user in ENDPOINTS}
+    add_data(db, 5, 400)
+    large = {label: query_count(client, path, user) for label, path, user in ENDPOINTS}
+    db.close()
+
+    failures = 0
+    for label, _, _ in ENDPOINTS:
+        if large[label] != small[label]:
+            failures += 1
+            print(f"FAIL {label}: {small[label]} queries with 5 orders, {large[label]} with 405")
+        else:
+            print(f"  ok {label} ({small[label]} queries)")
+
+    if failures:
+        print(f"{failures} endpoint(s) issue more queries as data grows")
+        sys.exit(1)
+    print("Query counts are constant")
+
+
+if __name__ == "__main__":
+    run()
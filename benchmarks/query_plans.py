@@ -0,0 +1,217 @@
+"""Fail if a hot lookup endpoint's queries fall back to a full table scan.
+
+Seeds a scratch database, calls each endpoint in-process, records every
+SELECT it issues and runs EXPLAIN on them, including the steps that fill
+materialized subqueries. On SQLite a plan step of the form ``SCAN <table>``
+is a full scan; on Postgres sequential scans are disabled for the check, so
+any ``Seq Scan`` left means no index can serve the query. Walking a whole
+index of one of the tables that grow with traffic (``SCAN orders USING
+INDEX ...``, or an index scan with no index condition) counts as a full
+scan too. Exits non-zero when one is found:
+
+    python benchmarks/query_plans.py
+    DATABASE_URL=postgresql://... python benchmarks/query_plans.py
+"""
+
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+# Every read must reach the database, and messages are only recorded
+os.environ["CATALOG_CACHE_SIZE"] = "0"
+os.environ["PRINCIPAL_CACHE_SIZE"] = "0"
+os.environ["NOTIFY_TRANSPORT"] = "fake"
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "plans.db")
+)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+import passwords  # noqa: E402
+from models import Like, Order, OrderItem, Product, ResetToken, UserModel  # noqa: E402
+
+# Tables that are allowed to be read in full: the FTS index and its shadow tables
+ALLOWED_SCANS = {"products_fts"}
+
+# Tables where walking a whole index is as bad as reading the table
+LARGE_TABLES = {"orders", "order_items", "like"}
+
+# "SCAN orders", optionally "USING [COVERING] INDEX ..." for a full index walk
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$")
+
+
+def seed(db):
+    password = passwords.pwd_context.hash("secret")
+    db.execute(insert(UserModel), [
+        {
+            "username": f"user{i}@{main.USERNAME_DOMAIN}",
+            "hashed_password": password,
+            "role": "buyer,seller",
+            "phone_number": f"98000{i:05d}",
+        }
+        for i in range(500)
+    ])
+    db.execute(insert(Product), [
+        {
+            "name": f"Product {i}",
+            "description": "fresh",
+            "price": "10",
+            "image_url": "",
+            "is_validated": i % 2 == 0,
+            "delivery_range_km": 5,
+            "phone_number": f"98000{i:05d}",
+            "expires_at": datetime.utcnow() + timedelta(days=1),
+        }
+        for i in range(500)
+    ])
+    db.execute(insert(Like), [{"product_id": i % 500 + 1, "like": 1} for i in range(2000)])
+    now = datetime.utcnow()
+    db.execute(insert(Order), [
+        {
+            "buyer": f"user{i % 500}@{main.USERNAME_DOMAIN}",
+            "phone_number": f"98000{i % 500:05d}",
+            "address": "Street",
+            "status": "Pending",
+            "timestamp": now - timedelta(minutes=i),
+        }
+        for i in range(5000)
+    ])
+    db.execute(insert(OrderItem), [
+        {"order_id": i % 5000 + 1, "product_id": i % 500 + 1, "quantity": 1}
+        for i in range(10000)
+    ])
+    db.execute(insert(ResetToken), [
+        {"user_id": i + 1, "token": f"token-{i}", "expires_at": now + timedelta(hours=1)}
+        for i in range(500)
+    ])
+    db.commit()
+
+
+def requests(client):
+    """The lookups to check, as (label, method, path, kwargs)."""
+    token = client.post(
+        "/token", data={"username": f"user7@{main.USERNAME_DOMAIN}", "password": "secret"}
+    ).json()["access_token"]
+    auth = {"headers": {"Authorization": f"Bearer {token}"}}
+    return [
+        ("POST /token", "post", "/token",
+         {"data": {"username": f"user7@{main.USERNAME_DOMAIN}", "password": "secret"}}),
+        ("GET /public-products", "get", "/public-products", {}),
+        ("GET /public-products?cursor", "get", "/public-products?cursor=100", {}),
+        ("GET /products/{id}", "get", "/products/42", {}),
+        ("POST /products/{id}/like", "post", "/products/42/like", {}),
+        ("GET /buyer/orders", "get", "/buyer/orders", auth),
+        ("GET /buyer/notifications", "get", "/buyer/notifications", auth),
+        ("GET /seller/orders", "get", "/seller/orders", auth),
+        ("GET /api/orders/by-phone", "get", "/api/orders/by-phone/9800000007", {}),
+        ("POST /send-username", "post", "/send-username", {"json": {"number": "9800000007"}}),
+        ("GET /reset-password/{token}", "get", "/reset-password/token-7", {}),
+    ]
+
+
+def sqlite_full_scans(conn, statement, params):
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params).all()
+    scans = []
+    for row in rows:
+        match = _SQLITE_SCAN.match(row[-1])
+        if not match:
+            continue
+        table, by_index = match.group(1), " USING " in row[-1]
+        # Scanning a materialized subquery is fine; the steps that fill it are checked too
+        if table in ALLOWED_SCANS or table.startswith("anon_"):
+            continue
+        if not by_index or table in LARGE_TABLES:
+            scans.append(row[-1])
+    return scans
+
+
+def _seq_scans(plan):
+    found = []
+    node, relation = plan.get("Node Type"), plan.get("Relation Name")
+    if node == "Seq Scan" and relation not in ALLOWED_SCANS:
+        found.append(f"Seq Scan on {relation}")
+    elif node in ("Index Scan", "Index Only Scan") and relation in LARGE_TABLES and "Index Cond" not in plan:
+        found.append(f"{node} of all of {relation} using {plan['Index Name']}")
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def postgres_full_scans(conn, statement, params):
+    conn.exec_driver_sql("SET enable_seqscan = off")
+    row = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, params).scalar()
+    return _seq_scans(row[0]["Plan"])
+
+
+def full_scans(engine, statement, params):
+    check = postgres_full_scans if engine.dialect.name == "postgresql" else sqlite_full_scans
+    with engine.connect() as conn:
+        return check(conn, statement, params)
+
+
+def from_asyncpg(statement, params):
+    """Rewrite asyncpg's ``$1`` placeholders for psycopg2 so the sync engine can EXPLAIN it."""
+    return re.sub(r"\$\d+", "%s", statement.replace("%", "%%")), tuple(params)
+
+
+def run():
+    main.apply_migrations()
+    db = database.SessionLocal()
+    seed(db)
+    db.close()
+
+    captured = []
+
+    def capture(engine):
+        def listener(conn, cursor, statement, params, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                captured.append((engine, statement, params))
+        return listener
+
+    database.get_async_sessionmaker()
+    event.listen(database.engine, "before_cursor_execute", capture("sync"))
+    event.listen(database.async_engine.sync_engine, "before_cursor_execute", capture("async"))
+
+    client = TestClient(main.app)
+    checks = requests(client)
+    checks.append(("cleanup: expired products", None, main.delete_expired_products, {}))
+
+    failures = 0
+    for label, method, target, kwargs in checks:
+        captured.clear()
+        if method is None:
+            target()
+        else:
+            response = getattr(client, method)(target, follow_redirects=False, **kwargs)
+            if response.status_code >= 400:
+                print(f"FAIL {label}: HTTP {response.status_code}")
+                failures += 1
+                continue
+        scans = []
+        for engine, statement, params in captured:
+            if engine == "async" and database.engine.dialect.name == "postgresql":
+                statement, params = from_asyncpg(statement, params)
+            scans += full_scans(database.engine, statement, params)
+        if scans:
+            failures += 1
+            print(f"FAIL {label}: {'; '.join(sorted(set(scans)))}")
+        else:
+            print(f"  ok {label} ({len(captured)} queries)")
+
+    if failures:
+        print(f"{failures} endpoint(s) fall back to a full table or index scan")
+        sys.exit(1)
+    print("All lookups use an index")
+
+
+if __name__ == "__main__":
+    run()
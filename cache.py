@@ -0,0 +1,167 @@
+# cache.py
+"""In-process caches for catalog reads and authenticated principals."""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "1024"))
+
+# Authenticated users are re-read from the database at most this often
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+
+MISSING = object()
+
+# Distinguishes this process's versions from those of other workers or restarts
+INSTANCE_ID = uuid.uuid4().hex[:8]
+
+
+class LRUCache:
+    """Size-bounded, thread-safe LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for ``key`` or ``MISSING``."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def replace_values(self, fn):
+        """Swap each cached value for ``fn(value)``, keeping its expiry and position."""
+        with self._lock:
+            for key, (expires, value) in self._data.items():
+                self._data[key] = (expires, fn(value))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+class VersionCounter:
+    """Monotonic counter bumped on every write to a resource."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+
+
+class CatalogCache:
+    """Versioned cache of serialized catalog pages and single-product payloads.
+
+    Every write to the catalog calls :meth:`invalidate`, which bumps
+    ``version`` and drops the cached pages (and the product's own entry when
+    an id is given), so readers never see data older than the last write in
+    this process. Likes only change one count, so :meth:`update_likes`
+    patches it into the cached pages and bumps ``likes_version`` instead.
+    Readers pass the versions they observed before querying to the
+    ``put_*`` methods so a result computed before a concurrent write is
+    never stored.
+    """
+
+    def __init__(self, maxsize: int = CATALOG_CACHE_SIZE, ttl: float = CATALOG_CACHE_TTL):
+        self.version = 0
+        self.likes_version = 0
+        self.pages = LRUCache(maxsize, ttl)
+        self.products = LRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+
+    def get_page(self, key):
+        return self.pages.get((self.version, key))
+
+    def put_page(self, key, value, version: int, likes_version: int):
+        with self._lock:
+            if version == self.version and likes_version == self.likes_version:
+                self.pages.set((version, key), value)
+
+    def get_product(self, product_id: int):
+        return self.products.get(product_id)
+
+    def put_product(self, product_id: int, value, version: int):
+        with self._lock:
+            if version == self.version:
+                self.products.set(product_id, value)
+
+    def invalidate(self, product_id: int = None):
+        with self._lock:
+            self.version += 1
+            self.pages.clear()
+            if product_id is None:
+                self.products.clear()
+            else:
+                self.products.invalidate(product_id)
+
+    def update_likes(self, product_id: int, likes: int):
+        """Set the like count of ``product_id`` on every cached page listing it."""
+
+        def patch(page):
+            if not any(item["id"] == product_id for item in page["items"]):
+                return page
+            items = [
+                {**item, "likes": likes} if item["id"] == product_id else item
+                for item in page["items"]
+            ]
+            return {**page, "items": items}
+
+        with self._lock:
+            self.likes_version += 1
+            self.pages.replace_values(patch)
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "likes_version": self.likes_version,
+            "pages": self.pages.stats(),
+            "products": self.products.stats(),
+        }
+
+
+catalog_cache = CatalogCache()
+order_version = VersionCounter()
+
+# Keyed by ("user", username) or ("admin", phone_number); writers that change a
+# user call principal_cache.invalidate with the same key after committing
+principal_cache = LRUCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
@@ -0,0 +1,135 @@
+# instrumentation.py
+"""Per-request database query counts and timings.
+
+``QueryStatsMiddleware`` opens a :class:`RequestStats` for every HTTP
+request. Cursor events on every SQLAlchemy engine, including the async
+engine's sync core, add to the stats of the request that issued the
+statement, found through a context variable. The totals go back to the
+client as ``Server-Timing`` headers, and requests over the thresholds are
+logged along with their slowest statement.
+"""
+
+import contextvars
+import logging
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this, or issuing more statements than this, are logged
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "20"))
+
+_current: contextvars.ContextVar[Optional["RequestStats"]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+class RequestStats:
+    """Statements run while handling one request and the time spent in them."""
+
+    __slots__ = ("queries", "db_seconds", "slowest_seconds", "slowest_statement")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Return the stats of the request being handled, if any."""
+    return _current.get()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    starts = conn.info.get("query_start")
+    if stats is not None and starts:
+        stats.record(statement, time.perf_counter() - starts.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def _server_timing(stats: RequestStats, total_seconds: float) -> bytes:
+    return (
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+        f"db-slowest;dur={stats.slowest_seconds * 1000:.1f}, "
+        f"app;dur={total_seconds * 1000:.1f}"
+    ).encode()
+
+
+def _one_line(statement: Optional[str], limit: int = 300) -> str:
+    text = " ".join((statement or "").split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware adding query counts and DB time to every HTTP response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (b"server-timing", _server_timing(stats, time.perf_counter() - start))
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - start
+            if elapsed * 1000 > SLOW_REQUEST_MS or stats.queries > SLOW_REQUEST_QUERIES:
+                logger.warning(
+                    "Slow request %s %s -> %s: %.1f ms, %d queries, %.1f ms in DB, "
+                    "slowest %.1f ms: %s",
+                    scope["method"],
+                    scope["path"],
+                    status,
+                    elapsed * 1000,
+                    stats.queries,
+                    stats.db_seconds * 1000,
+                    stats.slowest_seconds * 1000,
+                    _one_line(stats.slowest_statement),
+                )
@@ -7,28 +7,33 @@ from fastapi import (
     Body,
     UploadFile,
     File,
+    Query,
 )
 from fastapi.responses import (
     FileResponse,
     HTMLResponse,
     RedirectResponse,
     JSONResponse,
+    Response,
+    StreamingResponse,
 )
 
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 import logging
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
-from passlib.context import CryptContext
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import asyncio
-from sqlalchemy.orm import Session
+import time
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from models import (
     Admin,
-    Base,
     Order,
     OrderItem,
     UserModel as DBUser,
@@ -37,18 +42,29 @@ from models import (
     Shop,
     AddedProduct,
     Like,
+    StoredImage,
 )
-from database import engine, get_db, SessionLocal
+from database import dispose_async_engine, engine, get_async_db, get_db, pool_stats, SessionLocal
 from schemas import ProductOut
+from cache import INSTANCE_ID, MISSING, catalog_cache, order_version, principal_cache
+from search import search_products, setup_search
+from migrations import migrate
+from instrumentation import QueryStatsMiddleware
+import metrics
+from metrics import MetricsMiddleware
+from profiling import ProfilerMiddleware, profiler
+import storage
+import notifications
+import passwords
+from storage import LocalFileStorage, UploadTimeout, delete_images, hash_images, upload_images
 from fastapi.templating import Jinja2Templates
 import uuid
 from uuid import uuid4
 from pathlib import Path
-import smtplib
-from email.message import EmailMessage
-from twilio.rest import Client
+import csv
+import io
+import json
 import cloudinary
-import cloudinary.uploader
 
 cloudinary.config(
     cloud_name="dt6nx4ud7",
@@ -57,33 +73,124 @@ cloudinary.config(
     secure=True,
 )
 app = FastAPI()
+app.add_middleware(ProfilerMiddleware)
+# Added last so it runs first: MetricsMiddleware reads the query stats it opens
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(QueryStatsMiddleware)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-Base.metadata.create_all(bind=engine)
 
+# Products removed per DELETE statement by the expiry job
+CLEANUP_BATCH_SIZE = 1000
+CLEANUP_INTERVAL_SECONDS = 3600
 
-async def cleanup_expired_products():
-    """Periodically remove products past their expiry time."""
-    while True:
-        db = SessionLocal()
-        now = datetime.utcnow()
-        for product in db.query(DBProduct).all():
+# Outcome of the most recent expiry cleanup run
+cleanup_stats = {"last_run": None, "duration_seconds": None, "deleted": 0, "failures": 0}
+
+
+def delete_expired_products(now: Optional[datetime] = None) -> int:
+    """Delete products whose ``expires_at`` has passed, in bounded batches.
+
+    Each batch selects up to ``CLEANUP_BATCH_SIZE`` expired ids through the
+    ``expires_at`` index and removes them with one ``DELETE ... WHERE id IN``
+    committed on its own, so row locks are held only briefly. Order items
+    pointing at a removed product are kept with ``product_id`` cleared and
+    show as "[deleted]", like products removed by hand; their like counts
+    are deleted with them. A batch that fails
+    is logged and skipped, so one bad row cannot stall the rest of the run.
+    """
+    now = now or datetime.utcnow()
+    deleted = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            expired = db.execute(
+                select(DBProduct.id, DBProduct.image_url, DBProduct.image_hashes)
+                .where(DBProduct.expires_at < now, DBProduct.id > last_id)
+                .order_by(DBProduct.id)
+                .limit(CLEANUP_BATCH_SIZE)
+            ).all()
+            if not expired:
+                break
+            last_id = expired[-1].id
+            ids = [row.id for row in expired]
             try:
-                expiry = datetime.fromisoformat(product.expiry_datetime)
+                db.execute(
+                    update(OrderItem)
+                    .where(OrderItem.product_id.in_(ids))
+                    .values(product_id=None)
+                    .execution_options(synchronize_session=False)
+                )
+                db.execute(
+                    delete(Like)
+                    .where(Like.product_id.in_(ids))
+                    .execution_options(synchronize_session=False)
+                )
+                db.execute(
+                    delete(DBProduct)
+                    .where(DBProduct.id.in_(ids))
+                    .execution_options(synchronize_session=False)
+                )
+                unused = _release_images(db, expired)
+                db.commit()
             except Exception:
-                continue
-            if expiry < now:
-                db.delete(product)
-        db.commit()
+                db.rollback()
+                cleanup_stats["failures"] += 1
+                logger.exception(
+                    "Failed to delete expired products %d..%d", ids[0], ids[-1]
+                )
+            else:
+                delete_images(unused)
+                deleted += len(expired)
+            if len(expired) < CLEANUP_BATCH_SIZE:
+                break
+    finally:
         db.close()
-        await asyncio.sleep(3600)
+    return deleted
+
+
+async def cleanup_expired_products():
+    """Periodically remove products past their expiry time."""
+    while True:
+        started = time.perf_counter()
+        try:
+            # The DELETE runs in a worker thread so requests keep flowing
+            deleted = await asyncio.to_thread(delete_expired_products)
+        except Exception:
+            cleanup_stats["failures"] += 1
+            logger.exception("Expired product cleanup failed")
+        else:
+            duration = time.perf_counter() - started
+            cleanup_stats.update(
+                last_run=datetime.utcnow().isoformat(),
+                duration_seconds=duration,
+                deleted=deleted,
+            )
+            logger.info("Removed %d expired products in %.3fs", deleted, duration)
+            if deleted:
+                catalog_cache.invalidate()
+        await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+
+
+@app.on_event("startup")
+def apply_migrations():
+    # Runs before the background tasks below, which need the schema
+    migrate(engine)
+    setup_search(engine)
 
 
 @app.on_event("startup")
 async def start_background_tasks():
     asyncio.create_task(cleanup_expired_products())
+    asyncio.create_task(notifications.run_outbox_worker(SessionLocal))
+
+
+@app.on_event("shutdown")
+async def close_async_pool():
+    await dispose_async_engine()
 
 
 # Serve static frontend files
@@ -100,16 +207,7 @@ SECRET_KEY = os.getenv("SECRET_KEY", "secretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-# Email configuration for password reset
-EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-EMAIL_FROM = os.getenv("EMAIL_FROM", EMAIL_USER if EMAIL_USER else "")
-
-# Twilio WhatsApp configuration
-TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM")
+# Email and WhatsApp settings live in notifications.py
 APP_BASE_URL = os.getenv("APP_BASE_URL", "http://127.0.0.1:8000")
 
 # Domain suffix for usernames
@@ -118,9 +216,16 @@ USERNAME_DOMAIN = "kinbech.shop"
 # Flat service fee added to each order total
 SERVICE_FEE = 2.0
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Catalog pagination defaults
+CATALOG_PAGE_SIZE = 50
+CATALOG_MAX_PAGE_SIZE = 200
+
+# Orders fetched per server-side cursor batch when exporting
+EXPORT_BATCH_SIZE = 500
 
+# Seller order pagination defaults
+ORDER_PAGE_SIZE = 20
+ORDER_MAX_PAGE_SIZE = 100
 
 class UserCreate(BaseModel):
     username: str
@@ -184,12 +289,18 @@ def decode_token(token: str) -> Dict:
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    try:
+        return await passwords.hash_password(password)
+    except passwords.HashPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+async def verify_password(plain, hashed):
+    try:
+        return await passwords.verify_password(plain, hashed)
+    except passwords.HashPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
 
 def price_to_float(price: str) -> float:
@@ -203,6 +314,201 @@ def price_to_float(price: str) -> float:
         return 0.0
 
 
+# Eagerly loads an order's items and then their products with one query
+# each, so serializing any number of orders costs three queries
+_ORDER_ITEMS = selectinload(Order.items).selectinload(OrderItem.product)
+
+
+def _order_query(db: Session):
+    """Query orders with their items and products eagerly loaded."""
+    return db.query(Order).options(_ORDER_ITEMS)
+
+
+def _serialize_order(order: Order, items=None) -> dict:
+    """Common JSON shape for an order loaded through ``_order_query``.
+
+    ``items`` limits the output (and total) to a subset of the order's items.
+    """
+    items = [
+        {
+            "name": item.product.name if item.product else "[deleted]",
+            "price": item.product.price if item.product else "0",
+            "quantity": item.quantity,
+            "shop_name": item.shop_name or None,
+        }
+        for item in (order.items if items is None else items)
+    ]
+    return {
+        "id": order.id,
+        "address": order.address,
+        "items": items,
+        "total": sum(price_to_float(i["price"]) * i["quantity"] for i in items)
+        + SERVICE_FEE,
+        "status": order.status,
+        "timestamp": order.timestamp.isoformat(),
+    }
+
+
+def _buyer_phones(db: Session, orders) -> Dict[str, Optional[str]]:
+    """Map each order's buyer username to their phone number in one query."""
+    usernames = {o.buyer for o in orders if o.buyer}
+    if not usernames:
+        return {}
+    rows = (
+        db.query(DBUser.username, DBUser.phone_number)
+        .filter(DBUser.username.in_(usernames))
+        .all()
+    )
+    return dict(rows)
+
+
+def _seller_phone(db: Session, username: str) -> Optional[str]:
+    """Return the shop phone number that keys a seller's products."""
+    row = db.query(DBUser.phone_number).filter(DBUser.username == username).first()
+    return row[0] if row else None
+
+
+def _image_fields(image_url: Optional[str]) -> dict:
+    """Split a product's stored image URLs and attach their resized variants.
+
+    ``image_variants`` lines up with ``image_urls``; entries are None until
+    the storage backend has sizes for that image.
+    """
+    urls = image_url.split(",") if image_url else []
+    return {
+        "image_urls": urls,
+        "image_variants": [storage.image_storage.variants(url) for url in urls],
+    }
+
+
+def _bump_image(db: Session, digest: str) -> Optional[str]:
+    """Take a reference on the stored image for ``digest`` and return its URL.
+
+    The UPDATE locks the row until commit, so a concurrent release cannot
+    drop it to zero and delete the file in between. Returns None when no
+    row exists, including one released since the caller last looked.
+    """
+    return db.execute(
+        update(StoredImage)
+        .where(StoredImage.content_hash == digest)
+        .values(ref_count=StoredImage.ref_count + 1)
+        .returning(StoredImage.url)
+    ).scalar()
+
+
+def _acquire_images(db: Session, digests: List[str], uploaded: Dict[str, str]) -> List[Optional[str]]:
+    """Add one reference per product image and return the URL each is stored under.
+
+    ``uploaded`` maps the digests this request uploaded to their URLs; rows
+    are created for those not stored yet. Images whose row is gone and
+    that were not uploaded come back as None.
+    """
+    urls = []
+    for digest in digests:
+        url = _bump_image(db, digest)
+        if url is None and digest in uploaded:
+            try:
+                with db.begin_nested():
+                    db.add(StoredImage(content_hash=digest, url=uploaded[digest], ref_count=1))
+                url = uploaded[digest]
+            except IntegrityError:
+                # Another request stored the same bytes first; share its row
+                # and URL, so the reference is released against that row
+                url = _bump_image(db, digest)
+        urls.append(url)
+    return urls
+
+
+async def _upload_new(images: List[UploadFile], digests: List[str], stored: set) -> Dict[str, str]:
+    """Upload each distinct image whose digest is not in ``stored``."""
+    new = {}
+    for image, digest in zip(images, digests):
+        if digest not in stored:
+            new.setdefault(digest, image)
+    return dict(zip(new, await upload_images(list(new.values()), list(new))))
+
+
+def _release_images(db: Session, products) -> List[str]:
+    """Drop one reference per image of deleted ``products``.
+
+    Each product (a model or a row) gives its ``image_hashes``; products
+    saved before that column existed are matched on ``image_url``. Returns
+    the URLs nobody references any more; the caller deletes them from
+    storage once its transaction has committed.
+    """
+    digests, urls = [], []
+    for product in products:
+        if product.image_hashes:
+            digests.extend(product.image_hashes.split(","))
+        elif product.image_url:
+            urls.extend(product.image_url.split(","))
+    if not digests and not urls:
+        return []
+    for digest in digests:
+        db.execute(
+            update(StoredImage)
+            .where(StoredImage.content_hash == digest)
+            .values(ref_count=StoredImage.ref_count - 1)
+        )
+    for url in urls:
+        db.execute(
+            update(StoredImage)
+            .where(StoredImage.url == url)
+            .values(ref_count=StoredImage.ref_count - 1)
+        )
+    unused = db.query(StoredImage.id, StoredImage.url).filter(
+        StoredImage.content_hash.in_(set(digests)) | StoredImage.url.in_(set(urls)),
+        StoredImage.ref_count <= 0,
+    ).all()
+    if unused:
+        db.query(StoredImage).filter(
+            StoredImage.id.in_([row.id for row in unused]), StoredImage.ref_count <= 0
+        ).delete(synchronize_session=False)
+    return [row.url for row in unused]
+
+
+def _keyset_page(query, column, cursor: Optional[int], limit: int):
+    """Return one page of ``query`` ordered by ``column`` after ``cursor``.
+
+    One extra row is fetched to tell whether another page exists, so the
+    caller gets ``(rows, has_more)`` without a separate count query.
+    """
+    if cursor is not None:
+        query = query.filter(column > cursor)
+    rows = query.order_by(column).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+async def _keyset_page_async(db: AsyncSession, stmt, column, cursor: Optional[int], limit: int):
+    """``_keyset_page`` for a ``select()`` run on an ``AsyncSession``."""
+    if cursor is not None:
+        stmt = stmt.where(column > cursor)
+    rows = (await db.execute(stmt.order_by(column).limit(limit + 1))).all()
+    return rows[:limit], len(rows) > limit
+
+
+def _etag(*parts) -> str:
+    """Build a strong ETag from a resource version rather than the body."""
+    return '"' + "-".join([INSTANCE_ID, *(str(p) for p in parts)]) + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Return True when the client's If-None-Match covers ``etag``."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def _with_etag(content, etag: str) -> JSONResponse:
+    return JSONResponse(content=content, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (
@@ -216,9 +522,15 @@ def get_user(db: Session, username: str):
     return db.query(DBUser).filter(DBUser.username == username).first()
 
 
-def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: Session, username: str, password: str):
     user = get_user(db, username)
-    if user and verify_password(password, user.hashed_password):
+    if not user:
+        return None
+    # Return the connection to the pool while bcrypt runs; a login storm
+    # would otherwise hold one connection per waiting login
+    db.expunge(user)
+    db.rollback()
+    if await verify_password(password, user.hashed_password):
         return user
     return None
 
@@ -231,15 +543,20 @@ def get_current_user_from_token(
         if not username:
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        user = db.query(DBUser).filter(DBUser.username == username).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
+        principal = principal_cache.get(("user", username))
+        if principal is MISSING:
+            user = db.query(DBUser).filter(DBUser.username == username).first()
+            if not user:
+                raise HTTPException(status_code=401, detail="User not found")
+            principal = {
+                "username": user.username,
+                "full_name": user.full_name,
+                "role": tuple(user.role.split(",")),
+            }
+            principal_cache.set(("user", username), principal)
 
-        return {
-            "username": user.username,
-            "full_name": user.full_name,
-            "role": user.role.split(","),
-        }
+        # A fresh dict per request so handlers cannot alter the cached entry
+        return {**principal, "role": list(principal["role"])}
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
@@ -257,12 +574,18 @@ def get_current_admin_from_token(
     if not phone_number:
         raise HTTPException(status_code=401, detail="Invalid token payload")
     
-    # Query the admin based on the phone number from the token
-    admin = db.query(Admin).filter(Admin.phone_number == phone_number).first()
-    if not admin:
-        raise HTTPException(status_code=404, detail="Admin not found")
-    
-    return admin
+    cached = principal_cache.get(("admin", phone_number))
+    if cached is MISSING:
+        # Query the admin based on the phone number from the token
+        admin = db.query(Admin).filter(Admin.phone_number == phone_number).first()
+        if not admin:
+            raise HTTPException(status_code=404, detail="Admin not found")
+        cached = (admin.id, admin.phone_number, admin.role)
+        principal_cache.set(("admin", phone_number), cached)
+
+    # Detached copy, so it outlives the session that loaded it
+    admin_id, phone_number, role = cached
+    return Admin(id=admin_id, phone_number=phone_number, role=role)
 
 
 
@@ -276,53 +599,14 @@ def _generate_unique_username(base: str, db: Session) -> str:
 
 
 def _create_reset_token(user: DBUser, db: Session) -> str:
-    """Generate and store a password reset token for the user."""
+    """Generate a password reset token for the user; the caller commits."""
     token = str(uuid.uuid4())
     expires_at = datetime.utcnow() + timedelta(hours=1)
     db_token = ResetToken(user_id=user.id, token=token, expires_at=expires_at)
     db.add(db_token)
-    db.commit()
     return token
 
 
-def _send_email(to_email: str, subject: str, body: str):
-    """Send an email if credentials are configured, else log the message."""
-    if not (EMAIL_HOST and EMAIL_USER and EMAIL_PASSWORD):
-        logger.info("Email not configured. Would send to %s: %s", to_email, body)
-        return
-
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = EMAIL_FROM
-    msg["To"] = to_email
-    msg.set_content(body)
-
-    try:
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASSWORD)
-            server.send_message(msg)
-    except Exception as e:
-        logger.error("Failed to send email: %s", e)
-
-
-def _send_whatsapp(to_number: str, body: str):
-    """Send a WhatsApp message using Twilio if configured."""
-    if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_WHATSAPP_FROM):
-        logger.info("Twilio not configured. Would send to %s: %s", to_number, body)
-        return
-
-    try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        from_number = TWILIO_WHATSAPP_FROM
-        if not from_number.startswith("whatsapp:"):
-            from_number = f"whatsapp:{from_number}"
-        to = to_number if to_number.startswith("whatsapp:") else f"whatsapp:{to_number}"
-        client.messages.create(body=body, from_=from_number, to=to)
-    except Exception as e:
-        logger.error("Failed to send WhatsApp message: %s", e)
-
-
 @app.post("/register", status_code=201)
 async def register(user: UserCreate, db: Session = Depends(get_db)):
     base_name = user.username.split("@")[0]
@@ -336,7 +620,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
             detail=f"Username already registered. Suggested username: {suggestion}",
         )
 
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = DBUser(
         username=username,
         full_name=user.full_name,
@@ -355,7 +639,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     access_token = create_access_token(data={"sub": user.username})
@@ -370,10 +654,11 @@ async def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_d
         raise HTTPException(status_code=404, detail="User not found")
 
     # 2. Update its hashed_password with the new password hash
-    user.hashed_password = get_password_hash(data.new_password)
+    user.hashed_password = await get_password_hash(data.new_password)
 
     # 3. Commit the change to the database
     db.commit()
+    principal_cache.invalidate(("user", data.username))
 
     return {"msg": "Password reset successful"}
 
@@ -404,9 +689,10 @@ async def reset_password_token(token: str, new_password: str = Form(...), db: Se
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.hashed_password = get_password_hash(new_password)
+    user.hashed_password = await get_password_hash(new_password)
     db.delete(record)
     db.commit()
+    principal_cache.invalidate(("user", user.username))
 
     return RedirectResponse(url="/login", status_code=303)
 
@@ -443,6 +729,7 @@ def set_shop_name(
         raise HTTPException(status_code=400, detail="Shop name already taken")
     user.shop_name = name
     db.commit()
+    principal_cache.invalidate(("user", user.username))
     return {"shop_name": user.shop_name}
 
 
@@ -471,6 +758,7 @@ def update_seller_details(
     user.address = address
     user.phone_number = phone_number
     db.commit()
+    principal_cache.invalidate(("user", user.username))
     return {"address": user.address, "phone_number": user.phone_number}
 
 @app.post("/shops")
@@ -524,6 +812,7 @@ async def create_product(
     delivery_range_km: int = Form(...),
     phone_number: str = Form(...),
     images: List[UploadFile] = File(...),
+    expiry_datetime: Optional[datetime] = Form(None),
     db: Session = Depends(get_db),
 ):
     shop = db.query(Shop).filter(Shop.phone_number == phone_number).first()
@@ -539,83 +828,198 @@ async def create_product(
         raise HTTPException(status_code=400, detail="Phone number does not match registered user")
 
 
-    image_urls = []
+    # Uploads run in parallel on a bounded thread pool, off the event loop.
+    # Content already stored (by any product) is reused instead of uploaded.
+    try:
+        digests = await hash_images(images)
+        stored = set(db.scalars(
+            select(StoredImage.content_hash).where(StoredImage.content_hash.in_(set(digests)))
+        ))
+        uploaded = await _upload_new(images, digests, stored)
+        image_urls = _acquire_images(db, digests, uploaded)
+        gone = [i for i, url in enumerate(image_urls) if url is None]
+        if gone:
+            # A delete released these after the lookup above; store them again
+            gone_digests = [digests[i] for i in gone]
+            uploaded.update(await _upload_new([images[i] for i in gone], gone_digests, set()))
+            for i, url in zip(gone, _acquire_images(db, gone_digests, uploaded)):
+                image_urls[i] = url
+    except UploadTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Image upload failed: {e}")
 
-    for image in images:
-        try:
-            result = cloudinary.uploader.upload(
-                await image.read(),
-                folder="kinbech_uploads",  # Optional: Organize images
-                public_id=f"{uuid4().hex}",  # Unique filename
-                resource_type="image"
-            )
-            image_urls.append(result["secure_url"])
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Cloudinary upload failed: {e}")
+    # expires_at is naive UTC, compared with utcnow() by the cleanup job;
+    # a value without an offset is taken to be UTC already
+    if expiry_datetime is not None and expiry_datetime.tzinfo is not None:
+        expiry_datetime = expiry_datetime.astimezone(timezone.utc).replace(tzinfo=None)
 
     new_product = DBProduct(  # ✅ correct model (SQLAlchemy)
         name=name,
         description=description,
         price=price,
         image_url=",".join(image_urls),
+        image_hashes=",".join(digests),
         is_validated=False,
         delivery_range_km=delivery_range_km,
         phone_number=phone_number,
+        expires_at=expiry_datetime,
     )
 
 
     db.add(new_product)
     db.commit()
     db.refresh(new_product)
+    catalog_cache.invalidate(new_product.id)
     return {"msg": "Product added successfully"}
 
 
+@app.get("/media/{name}", include_in_schema=False)
+def get_media(name: str):
+    """Serve an image stored by the local backend with long-lived caching.
+
+    File names are content hashes, so a URL always refers to the same bytes
+    and browsers may cache it for a year without revalidating.
+    """
+    path = None
+    if isinstance(storage.image_storage, LocalFileStorage):
+        path = storage.image_storage.path_for(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(
+        path, headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+
 @app.get("/products")
 async def get_products(
+    cursor: Optional[int] = None,
+    limit: int = Query(CATALOG_PAGE_SIZE, ge=1, le=CATALOG_MAX_PAGE_SIZE),
     current_user: dict = Depends(get_current_user_from_token),
     db: Session = Depends(get_db),
 ):
-    """Return all validated products for the marketplace."""
+    """Return a page of validated products for the marketplace.
+
+    Admins also see each product's seller phone number and shop name,
+    joined in the same query. Pass the returned ``next_cursor`` back as
+    ``cursor`` to fetch the next page.
+    """
 
-    db_products = db.query(DBProduct).filter(DBProduct.is_validated == True).all()
+    rows, has_more = _keyset_page(
+        db.query(DBProduct, Shop.name)
+        .outerjoin(Shop, Shop.phone_number == DBProduct.phone_number)
+        .filter(DBProduct.is_validated == True),
+        DBProduct.id,
+        cursor,
+        limit,
+    )
 
     products = []
-    for p in db_products:
+    for p, shop_name in rows:
         item = {
             "id": p.id,
             "name": p.name,
             "description": p.description,
             "price": p.price,
-            "seller": p.seller,
-            "shop_name": p.shop_name,
-            "image_urls": p.image_url.split(","),
+            **_image_fields(p.image_url),
             "delivery_range_km": p.delivery_range_km,
-            "expiry_datetime": p.expiry_datetime,
+            "expires_at": p.expires_at.isoformat() if p.expires_at else None,
         }
 
         if "admin" in current_user["role"]:
-            item["shop_name"] = p.shop_name
+            item["phone_number"] = p.phone_number
+            item["shop_name"] = shop_name
         products.append(item)
 
-    return products
+    return {
+        "items": products,
+        "next_cursor": rows[-1][0].id if has_more else None,
+    }
 
 @app.get("/public-products")
-async def get_public_products(db: Session = Depends(get_db)):
-    """Return validated products without requiring authentication."""
-    db_products = db.query(DBProduct).filter(DBProduct.is_validated == True).all()
+async def get_public_products(
+    request: Request,
+    cursor: Optional[int] = None,
+    limit: int = Query(CATALOG_PAGE_SIZE, ge=1, le=CATALOG_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Return a page of validated products without requiring authentication.
+
+    Each row's like count is summed by a correlated subquery, which only
+    runs for the rows on the page, so the page is still one query. Pages
+    are keyed on product id; pass the returned ``next_cursor`` back as
+    ``cursor`` to continue. Serialized pages are kept in ``catalog_cache``
+    until the next catalog write, and the catalog and like versions double
+    as the page's ETag.
+    """
+    version = catalog_cache.version
+    likes_version = catalog_cache.likes_version
+    etag = _etag("catalog", version, likes_version, cursor, limit)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    cached = catalog_cache.get_page((cursor, limit))
+    if cached is not MISSING:
+        return _with_etag(cached, etag)
+
+    likes = (
+        select(func.coalesce(func.sum(Like.like), 0))
+        .where(Like.product_id == DBProduct.id)
+        .scalar_subquery()
+    )
+    rows, has_more = await _keyset_page_async(
+        db,
+        select(DBProduct, likes).where(DBProduct.is_validated == True),
+        DBProduct.id,
+        cursor,
+        limit,
+    )
     products = []
-    for p in db_products:
-        like_row = db.query(Like).filter(Like.product_id == p.id).first()
+    for p, likes in rows:
         products.append({
             "id": p.id,
             "name": p.name,
             "description": p.description,
             "price": p.price,
-            "image_urls": p.image_url.split(","),
+            **_image_fields(p.image_url),
             "delivery_range_km": p.delivery_range_km,
-            "likes": like_row.like if like_row else 0,
+            "likes": int(likes),
         })
-    return products
+    page = {
+        "items": products,
+        "next_cursor": rows[-1][0].id if has_more else None,
+    }
+    catalog_cache.put_page((cursor, limit), page, version, likes_version)
+    return _with_etag(page, etag)
+
+
+@app.get("/search")
+def search(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(CATALOG_PAGE_SIZE, ge=1, le=CATALOG_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """Return validated products matching ``q``, best matches first.
+
+    Uses the full-text index set up by ``search.setup_search``. Pass the
+    returned ``next_offset`` back as ``offset`` to fetch the next page.
+    """
+    rows = search_products(db, q, limit + 1, offset)
+    return {
+        "items": [
+            {
+                "id": r["id"],
+                "name": r["name"],
+                "description": r["description"],
+                "price": r["price"],
+                **_image_fields(r["image_url"]),
+                "delivery_range_km": r["delivery_range_km"],
+                "likes": int(r["likes"]),
+            }
+            for r in rows[:limit]
+        ],
+        "next_offset": offset + limit if len(rows) > limit else None,
+    }
 
 
 @app.post("/products/{product_id}/like")
@@ -629,6 +1033,11 @@ def like_product(product_id: int, db: Session = Depends(get_db)):
         like_row.like += 1
     db.commit()
     db.refresh(like_row)
+    # Pages show the sum over the product's like rows; patch just that count
+    likes = db.scalar(
+        select(func.coalesce(func.sum(Like.like), 0)).where(Like.product_id == product_id)
+    )
+    catalog_cache.update_likes(product_id, int(likes))
     return {"likes": like_row.like}
 
 @app.post("/buy/{product_id}")
@@ -658,6 +1067,7 @@ async def buy_product(
         )
     )
     db.commit()
+    order_version.bump()
 
     return {
         "msg": f"You bought '{product.name}' for ₹{product.price}",
@@ -675,7 +1085,19 @@ async def checkout(
 ):
     print("✅ Received checkout:", request.dict())
     # Use phone number or a default name as buyer info if needed
-    
+
+    # Load every product in the cart with one IN query and validate in memory
+    product_ids = {item.product_id for item in request.items}
+    products = {
+        p.id: p
+        for p in db.query(DBProduct).filter(DBProduct.id.in_(product_ids)).all()
+    }
+    for item in request.items:
+        product = products.get(item.product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        if not product.is_validated:
+            raise HTTPException(status_code=403, detail="Product not validated")
 
     order = Order(
         buyer=request.items[0].product_id,  # Use first product's ID as buyer for simplicity
@@ -687,25 +1109,21 @@ async def checkout(
     )
     db.add(order)
     db.flush()  # Get order.id
-    db.flush()  # Get order.id
 
-    for item in request.items:
-        product = db.query(DBProduct).filter(DBProduct.id == item.product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        if not product.is_validated:
-            raise HTTPException(status_code=403, detail="Product not validated")
-
-        db.add(
-            OrderItem(
-                order_id=order.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                
-            )
-        )
+    db.execute(
+        insert(OrderItem),
+        [
+            {
+                "order_id": order.id,
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+            }
+            for item in request.items
+        ],
+    )
 
     db.commit()
+    order_version.bump()
     return {"msg": "Order placed successfully!"}
 
 
@@ -719,8 +1137,11 @@ def delete_product(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
+    unused = _release_images(db, [product])
     db.delete(product)
     db.commit()
+    delete_images(unused)
+    catalog_cache.invalidate(product_id)
     return {"message": "Deleted successfully"}
 
 
@@ -749,6 +1170,7 @@ def update_product(
 
     db.commit()
     db.refresh(product)
+    catalog_cache.invalidate(product_id)
 
     return {"message": "Product updated successfully"}
 
@@ -837,40 +1259,54 @@ def get_products_by_phone(
 
 @app.get("/seller/orders")
 def get_seller_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(ORDER_PAGE_SIZE, ge=1, le=ORDER_MAX_PAGE_SIZE),
     current_user: dict = Depends(get_current_user_from_token),
     db: Session = Depends(get_db),
 ):
-    username = current_user["username"]
+    """Return a page of orders containing the seller's products, newest first.
 
-    orders = (
-        db.query(Order)
-        .join(OrderItem)
-        .join(DBProduct)
-        .filter(DBProduct.seller == username)
-        .all()
+    The lookup starts from the seller's products and follows the
+    ``order_items.product_id`` index to their orders, so it never walks
+    orders that do not concern the seller. Each order appears once and
+    lists only this seller's items. Pass the returned ``next_cursor`` back
+    as ``cursor`` to fetch older orders.
+    """
+    phone = _seller_phone(db, current_user["username"])
+    if not phone:
+        return {"items": [], "next_cursor": None}
+
+    seller_order_ids = (
+        select(OrderItem.order_id)
+        .join(DBProduct, DBProduct.id == OrderItem.product_id)
+        .where(DBProduct.phone_number == phone)
     )
+    query = _order_query(db).filter(Order.id.in_(seller_order_ids))
+    if cursor:
+        try:
+            ts, order_id = cursor.rsplit("_", 1)
+            position = (datetime.fromisoformat(ts), int(order_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(tuple_(Order.timestamp, Order.id) < position)
 
-    return [
-        {
-            "id": order.id,
-            "buyer": order.buyer,
-            "address": order.address,
-            "items": [
-                {
-                    "name": item.product.name,
-                    "price": item.product.price,
-                    "quantity": item.quantity,
-                    "shop_name": item.shop_name or (item.product.shop_name if item.product else None),
-                }
-                for item in order.items
-            ],
-            "total": sum(price_to_float(item.product.price) * item.quantity for item in order.items)
-            + SERVICE_FEE,
-            "timestamp": order.timestamp.isoformat(),
-            "status": order.status,
-        }
-        for order in orders
-    ]
+    rows = query.order_by(Order.timestamp.desc(), Order.id.desc()).limit(limit + 1).all()
+    orders = rows[:limit]
+    last = orders[-1] if len(rows) > limit else None
+
+    return {
+        "items": [
+            {
+                **_serialize_order(
+                    order,
+                    [i for i in order.items if i.product and i.product.phone_number == phone],
+                ),
+                "buyer": order.buyer,
+            }
+            for order in orders
+        ],
+        "next_cursor": f"{last.timestamp.isoformat()}_{last.id}" if last else None,
+    }
 
 
 def _fulfill_order_logic(order_id: int, current_user: dict, db: Session):
@@ -881,12 +1317,14 @@ def _fulfill_order_logic(order_id: int, current_user: dict, db: Session):
 
     # Check ownership unless user is an admin
     if "admin" not in current_user["role"]:
+        phone = _seller_phone(db, current_user["username"])
         for item in order.items:
-            if item.product.seller != current_user["username"]:
+            if not phone or not item.product or item.product.phone_number != phone:
                 raise HTTPException(status_code=403, detail="Unauthorized")
 
     order.status = "Fulfilled"
     db.commit()
+    order_version.bump()
     return {"msg": "Order marked as fulfilled"}
 
 
@@ -930,107 +1368,75 @@ def complete_order(
 
     order.status = "Completed"
     db.commit()
+    order_version.bump()
     return {"msg": "Order marked as completed"}
 
 
 @app.get("/buyer/notifications")
-def get_notifications(
+async def get_notifications(
+    request: Request,
     current_user: dict = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     username = current_user["username"]
+    etag = _etag("notifications", order_version.value, username)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
 
     orders = (
-        db.query(Order)
-        .filter(Order.buyer == username)
-        .order_by(Order.timestamp.desc())
-        .all()
-    )
+        await db.scalars(
+            select(Order).where(Order.buyer == username).order_by(Order.timestamp.desc())
+        )
+    ).all()
 
-    return [
-        {
-            "id": o.id,
-            "status": o.status,
-            "timestamp": o.timestamp.isoformat(),
-        }
-        for o in orders
-    ]
+    return _with_etag(
+        [
+            {
+                "id": o.id,
+                "status": o.status,
+                "timestamp": o.timestamp.isoformat(),
+            }
+            for o in orders
+        ],
+        etag,
+    )
 
 
 @app.get("/buyer/orders")
-def get_buyer_orders(
+async def get_buyer_orders(
+    request: Request,
     current_user: dict = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Return all orders for the logged in buyer."""
     username = current_user["username"]
+    # Items embed product names and prices, so catalog edits change the tag too
+    etag = _etag("orders", order_version.value, catalog_cache.version, username)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
 
     orders = (
-        db.query(Order)
-        .filter(Order.buyer == username)
-        .order_by(Order.timestamp.desc())
-        .all()
-    )
+        await db.scalars(
+            select(Order)
+            .options(_ORDER_ITEMS)
+            .where(Order.buyer == username)
+            .order_by(Order.timestamp.desc())
+        )
+    ).all()
 
-    return [
-        {
-            "id": o.id,
-            "address": o.address,
-            "items": [
-                {
-                    "name": item.product.name,
-                    "price": item.product.price,
-                    "quantity": item.quantity,
-                    "shop_name": item.shop_name or None,
-
-                }
-                for item in o.items
-            ],
-            "total": sum(price_to_float(item.product.price) * item.quantity for item in o.items)
-            + SERVICE_FEE,
-            "status": o.status,
-            "timestamp": o.timestamp.isoformat(),
-        }
-        for o in orders
-    ]
+    return _with_etag([_serialize_order(o) for o in orders], etag)
 
 
 @app.get("/api/orders/by-phone/{phone_number}")
 def get_orders_by_phone(phone_number: str, db: Session = Depends(get_db)):
     """Return orders matching the provided phone number."""
     orders = (
-        db.query(Order)
+        _order_query(db)
         .filter(Order.phone_number == phone_number)
         .order_by(Order.timestamp.desc())
         .all()
     )
-
-    output = []
-    for o in orders:
-        output.append(
-            {
-                "id": o.id,
-                "address": o.address,
-                "items": [
-                    {
-                        "name": item.product.name if item.product else "[deleted]",
-                        "price": item.product.price if item.product else "0",
-                        "quantity": item.quantity,
-                        
-                    }
-                    for item in o.items
-                ],
-                "total": sum(
-                    price_to_float(item.product.price if item.product else "0")
-                    * item.quantity
-                    for item in o.items
-                )
-                + SERVICE_FEE,
-                "status": o.status,
-                "timestamp": o.timestamp.isoformat(),
-            }
-        )
-    return output
+    return [_serialize_order(o) for o in orders]
 
 
 @app.get("/admin/sellers")
@@ -1053,48 +1459,72 @@ def list_sellers(
     ]
 
 @app.get("/admin/sellers/details")
-def list_seller_details(db: Session = Depends(get_db)):
-    sellers = db.query(DBUser).all()  # start with all users
-    output = []
-
-    for s in sellers:
-        # Check if the user is a seller by checking for a matching shop
-        shop = db.query(Shop).filter(Shop.phone_number == s.phone_number).first()
-        if not shop:
-            continue  # skip non-sellers
+def list_seller_details(
+    cursor: Optional[int] = None,
+    limit: int = Query(CATALOG_PAGE_SIZE, ge=1, le=CATALOG_MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Return a page of sellers with their shop and products.
 
-        products = db.query(DBProduct).filter(DBProduct.phone_number == s.phone_number).all()
+    A seller is a user with a shop under the same phone number. Each page
+    takes two queries however many users there are: users joined to shops,
+    then the products of every seller on the page. Pass the returned
+    ``next_cursor`` back as ``cursor`` to fetch the next page.
+    """
+    rows, has_more = _keyset_page(
+        db.query(DBUser, Shop).join(Shop, Shop.phone_number == DBUser.phone_number),
+        DBUser.id,
+        cursor,
+        limit,
+    )
 
-        output.append({
-            "shop_name": shop.name,  # assuming `shop.name` exists
-            "address": shop.address,
-            "phone_number": s.phone_number,
-            "products": [
-                {
-                    "id": p.id,
-                    "name": p.name,
-                    "description": p.description,
-                    "price": p.price,
-                    "delivery_range_km": p.delivery_range_km,
-                    "image_urls": p.image_url.split(","),
-                    "is_validated": p.is_validated,
-                }
-                for p in products
-            ],
-        })
+    products_by_phone: Dict[str, list] = {}
+    phones = {user.phone_number for user, _ in rows}
+    if phones:
+        for p in (
+            db.query(DBProduct)
+            .filter(DBProduct.phone_number.in_(phones))
+            .order_by(DBProduct.id)
+        ):
+            products_by_phone.setdefault(p.phone_number, []).append({
+                "id": p.id,
+                "name": p.name,
+                "description": p.description,
+                "price": p.price,
+                "delivery_range_km": p.delivery_range_km,
+                "image_urls": p.image_url.split(","),
+                "is_validated": p.is_validated,
+            })
 
-    return output
+    return {
+        "items": [
+            {
+                "username": user.username,
+                "shop_name": shop.name,
+                "address": shop.address,
+                "phone_number": user.phone_number,
+                "products": products_by_phone.get(user.phone_number, []),
+            }
+            for user, shop in rows
+        ],
+        "next_cursor": rows[-1][0].id if has_more else None,
+    }
 
 
 
 @app.get("/products/{product_id}", response_model=ProductOut)
-def get_product_public(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
+async def get_product_public(product_id: int, db: AsyncSession = Depends(get_async_db)):
+    version = catalog_cache.version
+    cached = catalog_cache.get_product(product_id)
+    if cached is not MISSING:
+        return cached
+
+    product = await db.get(DBProduct, product_id)
 
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    return {
+    payload = {
         "id": product.id,
         "name": product.name,
         "description": product.description,
@@ -1102,8 +1532,10 @@ def get_product_public(product_id: int, db: Session = Depends(get_db)):
         
         "delivery_range_km": product.delivery_range_km,
         
-        "image_urls": product.image_url.split(","),
+        **_image_fields(product.image_url),
     }
+    catalog_cache.put_product(product_id, payload, version)
+    return payload
 
 # Load HTML templates from the same directory as other static files
 templates = Jinja2Templates(directory="static")
@@ -1123,13 +1555,17 @@ async def process_forgot_password(email: str = Form(...), db: Session = Depends(
 
     token = _create_reset_token(user, db)
     reset_link = f"{APP_BASE_URL}/reset-password/{token}"
-    _send_email(
+    notifications.enqueue(
+        db,
+        notifications.EMAIL,
         email,
-        "Password Reset",
         f"Click the link to reset your password: {reset_link}",
+        subject="Password Reset",
     )
+    db.commit()
+    notifications.wake()
 
-    logger.info("Password reset link sent to: %s", email)
+    logger.info("Password reset link queued for: %s", email)
     return RedirectResponse(url="/login", status_code=303)
 
 
@@ -1148,9 +1584,13 @@ async def send_reset_link(payload: ResetRequest, db: Session = Depends(get_db)):
 
     token = _create_reset_token(user, db)
     reset_link = f"{APP_BASE_URL}/reset-password/{token}"
-    _send_whatsapp(payload.number, f"Reset your password here: {reset_link}")
+    notifications.enqueue(
+        db, notifications.WHATSAPP, payload.number, f"Reset your password here: {reset_link}"
+    )
+    db.commit()
+    notifications.wake()
 
-    logger.info("Reset link sent via WhatsApp to %s", payload.number)
+    logger.info("Reset link queued for WhatsApp to %s", payload.number)
     return {"msg": "Reset link sent to your WhatsApp!"}
 
 
@@ -1161,8 +1601,12 @@ async def send_username(payload: ResetRequest, db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=404, detail="Number not found")
 
-    _send_whatsapp(payload.number, f"Your username is: {user.username}")
-    logger.info("Username sent via WhatsApp to %s", payload.number)
+    notifications.enqueue(
+        db, notifications.WHATSAPP, payload.number, f"Your username is: {user.username}"
+    )
+    db.commit()
+    notifications.wake()
+    logger.info("Username queued for WhatsApp to %s", payload.number)
 
     return {"msg": "Username sent to your WhatsApp!"}
 
@@ -1208,6 +1652,7 @@ def validate_product(
         raise HTTPException(status_code=404, detail="Product not found")
     product.is_validated = True
     db.commit()
+    catalog_cache.invalidate(product_id)
     return {"msg": "Product validated"}
 
 
@@ -1221,8 +1666,11 @@ def admin_delete_product(
     product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
+    unused = _release_images(db, [product])
     db.delete(product)
     db.commit()
+    delete_images(unused)
+    catalog_cache.invalidate(product_id)
     return {"msg": "Product deleted"}
 
 
@@ -1255,36 +1703,84 @@ def get_all_orders(
 ):
     """Return all orders for admin view."""
     #require_admin(current_user)
-    orders = db.query(Order).all()
-    out = []
-    for order in orders:
-        buyer = db.query(DBUser).filter(DBUser.username == order.buyer).first()
-        out.append(
-            {
-                "id": order.id,
-                "buyer": order.buyer,
-                "phone_number": buyer.phone_number if buyer else None,
-                "address": order.address,
-                "items": [
-                     {
-                        "name": item.product.name if item.product else "[deleted]",
-                        "price": item.product.price if item.product else "0",
-                        "quantity": item.quantity,
-                        "shop_name": item.shop_name or (item.product.shop_name if item.product else None),
-                     }
-                    for item in order.items
-                ],
-                "total": sum(
-                    price_to_float(item.product.price if item.product else "0")
-                    * item.quantity
-                    for item in order.items
-                )
-                + SERVICE_FEE,
-                "timestamp": order.timestamp.isoformat(),
-                "status": order.status,
-            }
+    orders = _order_query(db).all()
+    phones = _buyer_phones(db, orders)
+    return [
+        {
+            **_serialize_order(order),
+            "buyer": order.buyer,
+            "phone_number": phones.get(order.buyer),
+        }
+        for order in orders
+    ]
+
+
+EXPORT_CSV_COLUMNS = [
+    "id", "buyer", "phone_number", "address", "status", "timestamp", "total", "items",
+]
+
+
+def _export_orders(fmt: str, start: Optional[datetime], end: Optional[datetime]):
+    """Yield exported orders batch by batch from a server-side cursor.
+
+    Runs in its own session because the request's session is closed before
+    a streaming body is sent.
+    """
+    db = SessionLocal()
+    try:
+        stmt = select(Order).options(
+            selectinload(Order.items).selectinload(OrderItem.product)
         )
-    return out
+        if start:
+            stmt = stmt.where(Order.timestamp >= start)
+        if end:
+            stmt = stmt.where(Order.timestamp < end)
+        stmt = stmt.order_by(Order.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_COLUMNS)
+        if fmt == "csv":
+            writer.writeheader()
+
+        for batch in db.execute(stmt).scalars().partitions():
+            phones = _buyer_phones(db, batch)
+            for order in batch:
+                row = {
+                    **_serialize_order(order),
+                    "buyer": order.buyer,
+                    "phone_number": phones.get(order.buyer),
+                }
+                if fmt == "csv":
+                    row["items"] = "; ".join(
+                        f"{i['name']} x{i['quantity']}" for i in row["items"]
+                    )
+                    writer.writerow(row)
+                else:
+                    buffer.write(json.dumps(row) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        remainder = buffer.getvalue()
+        if remainder:
+            yield remainder
+    finally:
+        db.close()
+
+
+@app.get("/admin/orders/export")
+def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    admin: Admin = Depends(get_current_admin_from_token),
+):
+    """Stream all orders, optionally limited to ``start <= timestamp < end``."""
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_orders(format, start, end),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
 
 
 # ------- Admin Frontend Pages -------
@@ -1348,7 +1844,7 @@ async def admin_phone_register(
     db_user = DBUser(
         username=username,
         full_name="Admin",
-        hashed_password=get_password_hash(random_password),
+        hashed_password=await get_password_hash(random_password),
         role="admin",
         phone_number=phone_number,
     )
@@ -1391,3 +1887,135 @@ async def admin_login(
 def admin_check():
     """Endpoint kept for compatibility but no longer performs auth."""
     return {"status": "ok"}
+
+
+@app.get("/admin/cache/stats", include_in_schema=False)
+def catalog_cache_stats(admin: Admin = Depends(get_current_admin_from_token)):
+    """Report catalog and principal cache sizes and hit/miss counters."""
+    return {**catalog_cache.stats(), "principals": principal_cache.stats()}
+
+
+@app.get("/admin/db/pool", include_in_schema=False)
+def database_pool_stats(admin: Admin = Depends(get_current_admin_from_token)):
+    """Report connections checked out, overflow in use and checkout waits."""
+    return pool_stats()
+
+
+@app.get("/admin/auth/stats", include_in_schema=False)
+def password_hash_stats(admin: Admin = Depends(get_current_admin_from_token)):
+    """Report queue depth and wait times of the password hashing pool."""
+    return passwords.hash_stats.snapshot()
+
+
+@metrics.registry.collector
+def _pool_metrics():
+    stats = pool_stats()
+    engines = [("sync", stats)] + ([("async", stats["async"])] if "async" in stats else [])
+    for name, kind, key, help in (
+        ("db_pool_size", "gauge", "size", "Connections the pool keeps open."),
+        ("db_pool_checked_out", "gauge", "checked_out", "Connections in use."),
+        ("db_pool_checked_in", "gauge", "checked_in", "Idle connections in the pool."),
+        ("db_pool_overflow", "gauge", "overflow", "Connections open beyond the pool size."),
+        ("db_pool_checkouts_total", "counter", "checkouts", "Connection checkouts."),
+        ("db_pool_waits_total", "counter", "waits", "Checkouts that waited for a free connection."),
+        ("db_pool_timeouts_total", "counter", "timeouts", "Checkouts that timed out."),
+    ):
+        yield name, kind, help, [({"engine": e}, s[key]) for e, s in engines if key in s]
+
+
+@metrics.registry.collector
+def _cache_metrics():
+    caches = {
+        "catalog_pages": catalog_cache.pages.stats(),
+        "catalog_products": catalog_cache.products.stats(),
+        "principals": principal_cache.stats(),
+    }
+    for name, kind, key, help in (
+        ("cache_hits_total", "counter", "hits", "Cache lookups that found an entry."),
+        ("cache_misses_total", "counter", "misses", "Cache lookups that did not."),
+        ("cache_hit_ratio", "gauge", "hit_ratio", "Hits over all lookups since start."),
+        ("cache_entries", "gauge", "size", "Entries currently cached."),
+    ):
+        yield name, kind, help, [({"cache": c}, s[key]) for c, s in caches.items()]
+
+
+@metrics.registry.collector
+def _background_metrics():
+    hashing = passwords.hash_stats.snapshot()
+    yield "password_hash_queued", "gauge", "Password hashes waiting for a worker.", [({}, hashing["queued"])]
+    yield "password_hash_running", "gauge", "Password hashes in progress.", [({}, hashing["running"])]
+    yield "password_hash_rejected_total", "counter", "Password operations refused with 503.", [({}, hashing["rejected"])]
+
+    yield "cleanup_interval_seconds", "gauge", "Seconds between expired product cleanups.", [({}, CLEANUP_INTERVAL_SECONDS)]
+    yield "cleanup_failures_total", "counter", "Expired product cleanup runs and batches that failed.", [({}, cleanup_stats["failures"])]
+    if cleanup_stats["last_run"]:
+        last_run = datetime.fromisoformat(cleanup_stats["last_run"]).replace(tzinfo=timezone.utc)
+        yield "cleanup_last_run_timestamp_seconds", "gauge", "When the last cleanup finished.", [({}, last_run.timestamp())]
+        yield "cleanup_last_duration_seconds", "gauge", "How long the last cleanup took.", [({}, cleanup_stats["duration_seconds"])]
+        yield "cleanup_last_deleted", "gauge", "Products removed by the last cleanup.", [({}, cleanup_stats["deleted"])]
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Expose request, pool, cache and background task metrics for Prometheus."""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+class ProfilerSettings(BaseModel):
+    enabled: bool
+    sample_rate: float = Field(0.01, ge=0, le=1)
+    route: Optional[str] = None  # path template, e.g. /admin/sellers/details
+    interval_ms: float = Field(5, gt=0, le=1000)
+
+
+@app.get("/admin/profiler", include_in_schema=False)
+def profiler_status(admin: Admin = Depends(get_current_admin_from_token)):
+    """Show the profiler settings and the profiles kept in memory."""
+    return {**profiler.settings(), "profiles": profiler.profiles()}
+
+
+@app.put("/admin/profiler", include_in_schema=False)
+def configure_profiler(
+    settings: ProfilerSettings, admin: Admin = Depends(get_current_admin_from_token)
+):
+    """Turn request profiling on or off, for a sampled fraction of requests or one route."""
+    if settings.route is not None and not any(
+        getattr(route, "path", None) == settings.route for route in app.routes
+    ):
+        raise HTTPException(status_code=400, detail="Unknown route")
+    profiler.configure(settings.enabled, settings.sample_rate, settings.route, settings.interval_ms)
+    logger.info("Profiler %s by admin %s: %s", "enabled" if settings.enabled else "disabled", admin.phone_number, settings)
+    return profiler.settings()
+
+
+@app.get("/admin/profiler/profiles/{profile_id}", include_in_schema=False)
+def download_profile(
+    profile_id: int,
+    format: str = Query("pstats", pattern="^(pstats|collapsed)$"),
+    admin: Admin = Depends(get_current_admin_from_token),
+):
+    """Download a profile as a pstats file or as collapsed stacks for flame graphs."""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if not profile.stacks:
+        # Requests shorter than one interval leave nothing pstats or flamegraph.pl can load
+        raise HTTPException(status_code=404, detail="Profile has no samples")
+    if format == "collapsed":
+        return Response(
+            profile.collapsed(),
+            media_type="text/plain",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+        )
+    return Response(
+        profile.pstats(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.pstats"'},
+    )
+
+
+@app.delete("/admin/profiler/profiles", include_in_schema=False)
+def clear_profiles(admin: Admin = Depends(get_current_admin_from_token)):
+    """Drop every stored profile."""
+    profiler.clear()
+    return {"status": "cleared"}
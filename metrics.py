@@ -0,0 +1,223 @@
+# metrics.py
+"""A small in-process metrics registry rendered in the Prometheus text format.
+
+Request metrics are recorded by ``MetricsMiddleware`` as requests finish.
+Everything else (pool, cache and background task state) is read from its
+owner when ``/metrics`` is scraped. Collectors registered with
+:meth:`Registry.collector` do that work, so nothing runs between scrapes.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.routing import Mount
+
+from instrumentation import current_stats
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# A sample is (labels, value); a family is (name, type, help, samples)
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """Bucketed observations per label combination, with their sum and count."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        names = self.labelnames + ("le",)
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                label_str = _format_labels(names, labels + (_format_value(bound),))
+                yield f"{self.name}_bucket{label_str} {cumulative}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {_format_value(total)}"
+            yield f"{self.name}_count{label_str} {cumulative}"
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors and renders them as text."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), **kwargs) -> Histogram:
+        metric = Histogram(name, help, labelnames, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterable[Family]]):
+        """Register ``fn`` to produce metric families at scrape time; usable as a decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                families = list(fn())
+            except Exception:
+                # One broken collector must not take down the whole scrape
+                logger.exception("Metrics collector %s failed", fn.__name__)
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    label_str = _format_labels(names, tuple(labels[n] for n in names))
+                    lines.append(f"{name}{label_str} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")
+)
+http_db_queries = registry.counter(
+    "http_request_db_queries_total", "SQL statements issued while handling requests.", ("method", "route")
+)
+http_db_seconds = registry.counter(
+    "http_request_db_seconds_total", "Time spent in SQL statements while handling requests.", ("method", "route")
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, status codes and latency per route.
+
+    Routes are labelled by their path template (``/products/{product_id}``),
+    not the raw path, so the number of series stays bounded. Requests
+    that match no route share the ``<unmatched>`` label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[dict] = None
+
+    def _route_label(self, scope) -> str:
+        if self._route_paths is None:
+            # Built on first use, after every route has been registered
+            self._route_paths = {}
+            for route in scope["app"].routes:
+                if isinstance(route, Mount):
+                    # Starlette sets the mounted app (static files) as the endpoint
+                    self._route_paths.setdefault(route.app, route.path + "/{path}")
+                elif hasattr(route, "endpoint"):
+                    self._route_paths.setdefault(route.endpoint, route.path)
+        return self._route_paths.get(scope.get("endpoint"), "<unmatched>")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self._route_label(scope)
+            method = scope["method"]
+            http_requests.inc((method, route, str(status)))
+            http_latency.observe((method, route), time.perf_counter() - start)
+            stats = current_stats()
+            if stats is not None and stats.queries:
+                http_db_queries.inc((method, route), stats.queries)
+                http_db_seconds.inc((method, route), stats.db_seconds)
@@ -0,0 +1,305 @@
+# migrations.py
+"""Versioned schema migrations, applied at startup or with ``python migrations.py``.
+
+Each migration runs once per database, in order, inside its own
+transaction, and is recorded in ``schema_migrations``. Migrations spell out
+their DDL instead of reading the current models or other modules, so later
+changes never alter what an old migration does. Add new ones to the end of
+``MIGRATIONS`` with the next version number; never edit an applied one.
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+# Serializes migrations when several Postgres workers start at once
+_PG_LOCK_ID = 4_862_031
+
+
+def _execute(conn, statements):
+    """Run DDL written with ``{serial}``/``{timestamp}`` column types for the dialect."""
+    types = (
+        {"serial": "SERIAL", "timestamp": "TIMESTAMP WITHOUT TIME ZONE"}
+        if conn.dialect.name == "postgresql"
+        else {"serial": "INTEGER", "timestamp": "DATETIME"}
+    )
+    for stmt in statements:
+        conn.execute(text(stmt.format(**types)))
+
+
+# The schema as the models created it before migrations existed. Databases
+# from that time already have these tables, hence IF NOT EXISTS.
+_BASELINE = [
+    """CREATE TABLE IF NOT EXISTS users (
+        id {serial} NOT NULL,
+        username VARCHAR,
+        full_name VARCHAR,
+        hashed_password VARCHAR,
+        role VARCHAR,
+        shop_name VARCHAR,
+        address VARCHAR,
+        phone_number VARCHAR,
+        PRIMARY KEY (id),
+        UNIQUE (shop_name)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+    """CREATE TABLE IF NOT EXISTS products (
+        id {serial} NOT NULL,
+        name VARCHAR,
+        description VARCHAR,
+        price VARCHAR,
+        image_url VARCHAR,
+        is_validated BOOLEAN,
+        delivery_range_km INTEGER,
+        phone_number VARCHAR NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (phone_number)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_products_id ON products (id)",
+    """CREATE TABLE IF NOT EXISTS sellers (
+        id {serial} NOT NULL,
+        name VARCHAR,
+        PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_sellers_id ON sellers (id)",
+    """CREATE TABLE IF NOT EXISTS orders (
+        id {serial} NOT NULL,
+        buyer VARCHAR,
+        address VARCHAR,
+        phone_number VARCHAR,
+        status VARCHAR,
+        timestamp {timestamp},
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS order_items (
+        id {serial} NOT NULL,
+        order_id INTEGER,
+        product_id INTEGER,
+        shop_name VARCHAR,
+        quantity INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(order_id) REFERENCES orders (id),
+        FOREIGN KEY(product_id) REFERENCES products (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS reset_tokens (
+        id {serial} NOT NULL,
+        user_id INTEGER,
+        token VARCHAR,
+        expires_at {timestamp},
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id)
+    )""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_reset_tokens_token ON reset_tokens (token)",
+    """CREATE TABLE IF NOT EXISTS shop (
+        id {serial} NOT NULL,
+        name VARCHAR NOT NULL,
+        address VARCHAR NOT NULL,
+        phone_number VARCHAR NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT uix_phone_number UNIQUE (phone_number),
+        UNIQUE (phone_number)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_shop_id ON shop (id)",
+    # The models named this constraint uix_phone_number as well, which
+    # Postgres rejects because shop's unique index already has that name
+    """CREATE TABLE IF NOT EXISTS admin (
+        id {serial} NOT NULL,
+        phone_number VARCHAR NOT NULL,
+        role VARCHAR,
+        PRIMARY KEY (id),
+        CONSTRAINT uix_admin_phone_number UNIQUE (phone_number),
+        UNIQUE (phone_number)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_admin_id ON admin (id)",
+    """CREATE TABLE IF NOT EXISTS added_products (
+        id {serial} NOT NULL,
+        user_id INTEGER,
+        product_name VARCHAR NOT NULL,
+        details VARCHAR,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_added_products_id ON added_products (id)",
+    """CREATE TABLE IF NOT EXISTS "like" (
+        id {serial} NOT NULL,
+        product_id INTEGER,
+        "like" INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(product_id) REFERENCES products (id)
+    )""",
+    'CREATE INDEX IF NOT EXISTS ix_like_id ON "like" (id)',
+]
+
+
+def _baseline(conn):
+    """Create the tables that predate migrations."""
+    _execute(conn, _BASELINE)
+
+
+def _products_expires_at(conn):
+    """Add ``products.expires_at`` to databases created before it existed."""
+    # Databases from before migrations may already have the column
+    columns = {c["name"] for c in inspect(conn).get_columns("products")}
+    if "expires_at" not in columns:
+        _execute(conn, ["ALTER TABLE products ADD COLUMN expires_at {timestamp}"])
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_expires_at ON products (expires_at)"))
+
+
+# Secondary indexes for the columns request handlers filter and sort by
+_LOOKUP_INDEXES = [
+    ("ix_orders_buyer_timestamp", "orders", "buyer, timestamp"),
+    ("ix_orders_phone_number_timestamp", "orders", "phone_number, timestamp"),
+    ("ix_orders_timestamp", "orders", "timestamp"),
+    ("ix_order_items_order_id", "order_items", "order_id"),
+    ("ix_order_items_product_id", "order_items", "product_id"),
+    ("ix_like_product_id", '"like"', "product_id"),
+    ("ix_products_validated_id", "products", "is_validated, id"),
+    ("ix_users_phone_number", "users", "phone_number"),
+    ("ix_reset_tokens_expires_at", "reset_tokens", "expires_at"),
+]
+
+
+def _lookup_indexes(conn):
+    for name, table, columns in _LOOKUP_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+# Databases migrated before these tables had their own migrations got them
+# from the old create_all baseline, hence IF NOT EXISTS.
+def _stored_images(conn):
+    _execute(conn, [
+        """CREATE TABLE IF NOT EXISTS stored_images (
+            id {serial} NOT NULL,
+            content_hash VARCHAR NOT NULL,
+            url VARCHAR NOT NULL,
+            ref_count INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (content_hash),
+            UNIQUE (url)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_stored_images_id ON stored_images (id)",
+    ])
+
+
+def _outbox_messages(conn):
+    _execute(conn, [
+        """CREATE TABLE IF NOT EXISTS outbox_messages (
+            id {serial} NOT NULL,
+            channel VARCHAR NOT NULL,
+            recipient VARCHAR NOT NULL,
+            subject VARCHAR,
+            body VARCHAR NOT NULL,
+            status VARCHAR NOT NULL,
+            attempts INTEGER NOT NULL,
+            next_attempt_at {timestamp} NOT NULL,
+            last_error VARCHAR,
+            created_at {timestamp},
+            sent_at {timestamp},
+            PRIMARY KEY (id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_outbox_messages_id ON outbox_messages (id)",
+        "CREATE INDEX IF NOT EXISTS ix_outbox_messages_due ON outbox_messages (status, next_attempt_at)",
+    ])
+
+
+# The expression must match search._PG_DOCUMENT for queries to use the index
+_PG_SEARCH = [
+    "CREATE INDEX IF NOT EXISTS ix_products_search ON products USING GIN "
+    "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '')))",
+]
+
+_SQLITE_SEARCH = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, description, content='products', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO products_fts(rowid, name, description) "
+    "VALUES (new.id, new.name, new.description); END",
+    # Index the rows that were inserted before the table existed
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+]
+
+
+def _product_search(conn):
+    """Full-text index on product names and descriptions.
+
+    Search used to create these itself at startup, hence IF NOT EXISTS. An
+    SQLite build without FTS5 keeps the LIKE fallback in ``search.py``.
+    """
+    if conn.dialect.name == "postgresql":
+        _execute(conn, _PG_SEARCH)
+    elif conn.dialect.name == "sqlite":
+        try:
+            with conn.begin_nested():
+                _execute(conn, _SQLITE_SEARCH)
+        except OperationalError as e:
+            logger.warning("FTS5 unavailable, product search will use LIKE: %s", e)
+
+
+def _products_image_hashes(conn):
+    conn.execute(text("ALTER TABLE products ADD COLUMN image_hashes VARCHAR"))
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "products.expires_at", _products_expires_at),
+    (3, "lookup indexes", _lookup_indexes),
+    (4, "stored_images", _stored_images),
+    (5, "outbox_messages", _outbox_messages),
+    (6, "product search index", _product_search),
+    (7, "products.image_hashes", _products_image_hashes),
+]
+
+
+def migrate(engine) -> list:
+    """Apply pending migrations and return the versions that were applied."""
+    applied_now = []
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _PG_LOCK_ID})
+            conn.commit()
+        try:
+            with conn.begin():
+                conn.execute(text(
+                    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                    "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP)"
+                ))
+            applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+            conn.commit()
+            for version, name, apply in MIGRATIONS:
+                if version in applied:
+                    continue
+                with conn.begin():
+                    apply(conn)
+                    conn.execute(
+                        text("INSERT INTO schema_migrations (version, name, applied_at) "
+                             "VALUES (:version, :name, :applied_at)"),
+                        {"version": version, "name": name, "applied_at": datetime.utcnow()},
+                    )
+                logger.info("Applied migration %s: %s", version, name)
+                applied_now.append(version)
+        finally:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _PG_LOCK_ID})
+                conn.commit()
+    return applied_now
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    applied = migrate(engine)
+    print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
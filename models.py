@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, create_engine, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, create_engine, UniqueConstraint, Index
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy import DateTime
 from datetime import datetime
@@ -20,7 +20,7 @@ class UserModel(Base):
     shop_name = Column(String, unique=True)
 
     address = Column(String, nullable=True)
-    phone_number = Column(String, nullable=True)
+    phone_number = Column(String, nullable=True, index=True)
 
 
 class Product(Base):
@@ -33,6 +33,14 @@ class Product(Base):
     is_validated = Column(Boolean, default=False)
     delivery_range_km = Column(Integer)
     phone_number = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=True, index=True)
+    # SHA-256 of each image, in image_url order; keys the stored_images rows
+    image_hashes = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Serves the catalog's "validated, ordered by id" pages
+        Index("ix_products_validated_id", "is_validated", "id"),
+    )
 
 
 class Seller(Base):
@@ -51,15 +59,20 @@ class Order(Base):
     address = Column(String)
     phone_number = Column(String) 
     status = Column(String, default="Pending")
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     items = relationship("OrderItem", back_populates="order")
 
+    __table_args__ = (
+        Index("ix_orders_buyer_timestamp", "buyer", "timestamp"),
+        Index("ix_orders_phone_number_timestamp", "phone_number", "timestamp"),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     shop_name = Column(String)
     quantity = Column(Integer)
     order = relationship("Order", back_populates="items")
@@ -74,7 +87,7 @@ class ResetToken(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     token = Column(String, unique=True, index=True)
-    expires_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
 
     user = relationship("UserModel")
 
@@ -96,7 +109,7 @@ class Admin(Base):
     phone_number = Column(String, unique=True, nullable=False)
     role = Column(String)
     __table_args__ = (
-        UniqueConstraint('phone_number', name='uix_phone_number'),
+        UniqueConstraint('phone_number', name='uix_admin_phone_number'),
     )
 
 class AddedProduct(Base):
@@ -112,13 +125,46 @@ class AddedProduct(Base):
     user = relationship("UserModel")
 
 
+class StoredImage(Base):
+    """One stored image file, shared by every product that uses the same bytes."""
+
+    __tablename__ = "stored_images"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String, unique=True, nullable=False)
+    url = Column(String, unique=True, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+
+
+class OutboxMessage(Base):
+    """A WhatsApp or email message waiting to be delivered by the outbox worker."""
+
+    __tablename__ = "outbox_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String, nullable=False)  # "email" or "whatsapp"
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=True)
+    body = Column(String, nullable=False)
+    status = Column(String, default="pending", nullable=False)  # pending, sent, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_messages_due", "status", "next_attempt_at"),
+    )
+
+
 class Like(Base):
     """Simple like count for each product."""
 
     __tablename__ = "like"
 
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     like = Column(Integer, default=0)
 
 
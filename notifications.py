@@ -0,0 +1,222 @@
+# notifications.py
+"""Durable outbox for WhatsApp and email messages and the worker that sends them.
+
+Request handlers only call :func:`enqueue`, which adds an ``OutboxMessage``
+row to their transaction. The background worker picks up due rows in
+batches, sends each channel's batch over one reused client or SMTP
+connection, and retries failures with exponential backoff.
+"""
+
+import asyncio
+import logging
+import os
+import smtplib
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+from twilio.rest import Client
+
+from models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# Email configuration for password reset
+EMAIL_HOST = os.getenv("EMAIL_HOST")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+EMAIL_FROM = os.getenv("EMAIL_FROM", EMAIL_USER if EMAIL_USER else "")
+
+# Twilio WhatsApp configuration
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM")
+
+# "fake" records messages in memory instead of sending them (for tests)
+NOTIFY_TRANSPORT = os.getenv("NOTIFY_TRANSPORT", "")
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "30"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = 30
+
+EMAIL = "email"
+WHATSAPP = "whatsapp"
+
+
+class Transport:
+    """Delivers a batch of messages for one channel."""
+
+    def send_batch(self, messages: List[OutboxMessage]) -> List[Optional[Exception]]:
+        """Send ``messages`` and return the error for each one, or None on success."""
+        raise NotImplementedError
+
+
+class LogTransport(Transport):
+    """Used when a channel has no credentials: logs what would have been sent."""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+
+    def send_batch(self, messages):
+        for m in messages:
+            logger.info("%s not configured. Would send to %s: %s", self.channel, m.recipient, m.body)
+        return [None] * len(messages)
+
+
+class FakeTransport(Transport):
+    """Records every message so tests can assert on what was sent.
+
+    The first ``fail_times`` batches fail for every message in them, to
+    exercise retries.
+    """
+
+    def __init__(self, fail_times: int = 0):
+        self.sent = []
+        self.fail_times = fail_times
+
+    def send_batch(self, messages):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            return [ConnectionError("fake send failure")] * len(messages)
+        self.sent.extend((m.channel, m.recipient, m.subject, m.body) for m in messages)
+        return [None] * len(messages)
+
+
+class SMTPTransport(Transport):
+    """Sends a whole batch over a single STARTTLS SMTP session."""
+
+    def send_batch(self, messages):
+        errors = []
+        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
+            server.starttls()
+            server.login(EMAIL_USER, EMAIL_PASSWORD)
+            for m in messages:
+                msg = EmailMessage()
+                msg["Subject"] = m.subject or ""
+                msg["From"] = EMAIL_FROM
+                msg["To"] = m.recipient
+                msg.set_content(m.body)
+                try:
+                    server.send_message(msg)
+                    errors.append(None)
+                except smtplib.SMTPException as e:
+                    errors.append(e)
+        return errors
+
+
+class TwilioWhatsAppTransport(Transport):
+    """Sends WhatsApp messages through one Twilio client reused across batches."""
+
+    def __init__(self):
+        self.client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        self.from_number = TWILIO_WHATSAPP_FROM
+        if not self.from_number.startswith("whatsapp:"):
+            self.from_number = f"whatsapp:{self.from_number}"
+
+    def send_batch(self, messages):
+        errors = []
+        for m in messages:
+            to = m.recipient if m.recipient.startswith("whatsapp:") else f"whatsapp:{m.recipient}"
+            try:
+                self.client.messages.create(body=m.body, from_=self.from_number, to=to)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+
+def _create_transports() -> Dict[str, Transport]:
+    if NOTIFY_TRANSPORT == "fake":
+        fake = FakeTransport()
+        return {EMAIL: fake, WHATSAPP: fake}
+    transports = {EMAIL: LogTransport("Email"), WHATSAPP: LogTransport("Twilio")}
+    if EMAIL_HOST and EMAIL_USER and EMAIL_PASSWORD:
+        transports[EMAIL] = SMTPTransport()
+    if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_WHATSAPP_FROM:
+        transports[WHATSAPP] = TwilioWhatsAppTransport()
+    return transports
+
+
+transports = _create_transports()
+
+_wakeup: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def enqueue(db: Session, channel: str, recipient: str, body: str, subject: Optional[str] = None):
+    """Queue a message in the caller's transaction; it is sent after commit."""
+    db.add(OutboxMessage(channel=channel, recipient=recipient, subject=subject, body=body))
+
+
+def wake():
+    """Ask the worker to look for new messages now rather than at the next poll."""
+    if _loop is not None and _wakeup is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+def deliver_pending(session_factory, now: Optional[datetime] = None) -> int:
+    """Send one batch of due messages and return how many were attempted."""
+    now = now or datetime.utcnow()
+    db = session_factory()
+    try:
+        batch = (
+            db.query(OutboxMessage)
+            .filter(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now)
+            .order_by(OutboxMessage.id)
+            .limit(OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        by_channel: Dict[str, List[OutboxMessage]] = {}
+        for m in batch:
+            by_channel.setdefault(m.channel, []).append(m)
+
+        for channel, messages in by_channel.items():
+            transport = transports.get(channel)
+            try:
+                if transport is None:
+                    raise ValueError(f"Unknown channel {channel!r}")
+                errors = transport.send_batch(messages)
+            except Exception as e:
+                # Connection-level failure: the whole batch is retried
+                errors = [e] * len(messages)
+            for m, error in zip(messages, errors):
+                m.attempts += 1
+                if error is None:
+                    m.status = "sent"
+                    m.sent_at = datetime.utcnow()
+                    m.last_error = None
+                    continue
+                m.last_error = str(error)
+                if m.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    m.status = "failed"
+                    logger.error("Giving up on %s message %s: %s", channel, m.id, error)
+                else:
+                    delay = OUTBOX_BACKOFF_SECONDS * 2 ** (m.attempts - 1)
+                    m.next_attempt_at = now + timedelta(seconds=delay)
+        db.commit()
+        return len(batch)
+    finally:
+        db.close()
+
+
+async def run_outbox_worker(session_factory):
+    """Deliver outbox messages forever, waking early when :func:`wake` is called."""
+    global _wakeup, _loop
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    while True:
+        _wakeup.clear()
+        try:
+            # Keep draining while full batches come back
+            while await asyncio.to_thread(deliver_pending, session_factory) >= OUTBOX_BATCH_SIZE:
+                pass
+        except Exception:
+            logger.exception("Outbox delivery failed")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
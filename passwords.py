@@ -0,0 +1,108 @@
+# passwords.py
+"""Password hashing on a bounded thread pool so bcrypt never blocks the event loop."""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# bcrypt cost factor; each +1 doubles the time per hash
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Hashes run at once, and how many may wait before callers are turned away
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+
+
+class HashPoolBusy(Exception):
+    """Raised when more than ``HASH_MAX_QUEUE`` hashes are already waiting."""
+
+
+class HashPoolStats:
+    """Queue depth and timing counters for the hashing pool."""
+
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "workers": HASH_WORKERS,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_seconds": self.wait_seconds / self.completed if self.completed else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+                "avg_run_seconds": self.run_seconds / self.completed if self.completed else 0.0,
+            }
+
+
+hash_stats = HashPoolStats()
+
+
+def _timed(fn, submitted: float, picked_up: list, *args):
+    started = time.perf_counter()
+    with hash_stats._lock:
+        picked_up.append(started)
+        hash_stats.queued -= 1
+        hash_stats.running += 1
+    try:
+        return fn(*args)
+    finally:
+        finished = time.perf_counter()
+        with hash_stats._lock:
+            hash_stats.running -= 1
+            hash_stats.completed += 1
+            hash_stats.wait_seconds += started - submitted
+            hash_stats.max_wait_seconds = max(hash_stats.max_wait_seconds, started - submitted)
+            hash_stats.run_seconds += finished - started
+
+
+async def _run(fn, *args):
+    with hash_stats._lock:
+        if hash_stats.queued >= HASH_MAX_QUEUE:
+            hash_stats.rejected += 1
+            raise HashPoolBusy("Too many password operations in progress")
+        hash_stats.queued += 1
+    # Set by _timed once a worker takes the job off the queue
+    picked_up = []
+
+    def _release(_future=None):
+        # Jobs cancelled or refused before a worker ran them still hold a queue slot
+        with hash_stats._lock:
+            if not picked_up:
+                hash_stats.queued -= 1
+
+    try:
+        future = _hash_pool.submit(_timed, fn, time.perf_counter(), picked_up, *args)
+    except BaseException:
+        _release()
+        raise
+    future.add_done_callback(_release)
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password(password: str) -> str:
+    """Return the bcrypt hash of ``password``, computed on the pool."""
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_password(plain: str, hashed: str) -> bool:
+    """Check ``plain`` against ``hashed`` on the pool."""
+    return await _run(pwd_context.verify, plain, hashed)
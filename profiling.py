@@ -0,0 +1,252 @@
+# profiling.py
+"""Opt-in sampling profiler for live requests.
+
+An admin turns it on for a fraction of requests, optionally only those
+matching one route. While a chosen request runs, a background thread
+samples the Python stacks of every thread, so work handed to the
+threadpool is seen as well as the event loop. Only stacks passing through
+the application's own modules count, which leaves out idle workers; any
+other request running at the same moment is sampled too.
+
+The last ``PROFILE_BUFFER_SIZE`` profiles are kept in memory and can be
+downloaded as a pstats file (times and "calls" are sample based) or as
+collapsed stacks for flamegraph.pl and speedscope. While the profiler is
+off, its middleware only reads one attribute per request.
+"""
+
+import itertools
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Optional
+
+from starlette.routing import Match
+
+# Finished profiles kept for download
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+
+# Default time between stack samples
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _is_app_file(filename: str) -> bool:
+    return filename.startswith(APP_ROOT) and "site-packages" not in filename
+
+
+class _Sampler(threading.Thread):
+    """Counts the stacks of every other thread until stopped."""
+
+    def __init__(self, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                if any(_is_app_file(filename) for filename, _, _ in stack):
+                    self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profile:
+    """One sampled request and the stacks seen while it ran."""
+
+    def __init__(self, profile_id, method, path, route, started_at, interval):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.route = route
+        self.started_at = started_at
+        self.interval = interval
+        self.status = None
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 1),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+        }
+
+    def collapsed(self) -> str:
+        """Folded stacks, one ``root;...;leaf count`` line each."""
+        lines = []
+        for stack, count in self.stacks.most_common():
+            frames = ";".join(f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats(self) -> bytes:
+        """The samples in the marshal format ``pstats.Stats`` loads."""
+        stats = {}
+        for stack, count in self.stacks.items():
+            seconds = count * self.interval
+            seen = set()
+            for depth, func in enumerate(stack):
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                leaf = depth == len(stack) - 1
+                entry[1] += count
+                if func not in seen:
+                    # Recursive frames count once towards inclusive time
+                    entry[0] += count
+                    entry[3] += seconds
+                    seen.add(func)
+                if leaf:
+                    entry[2] += seconds
+                if depth:
+                    caller = entry[4].setdefault(stack[depth - 1], [0, 0, 0.0, 0.0])
+                    caller[0] += count
+                    caller[1] += count
+                    caller[3] += seconds
+                    if leaf:
+                        caller[2] += seconds
+        return marshal.dumps({
+            func: (cc, nc, tt, ct, {caller: tuple(v) for caller, v in callers.items()})
+            for func, (cc, nc, tt, ct, callers) in stats.items()
+        })
+
+
+class RequestProfiler:
+    """Decides which requests to sample and keeps their recent profiles."""
+
+    def __init__(self, buffer_size: int = PROFILE_BUFFER_SIZE):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.route: Optional[str] = None
+        self.interval = PROFILE_INTERVAL_MS / 1000
+        self.skipped_busy = 0
+        self._profiles = deque(maxlen=buffer_size)
+        self._ids = itertools.count(1)
+        self._active = None
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, sample_rate: float, route: Optional[str] = None, interval_ms: Optional[float] = None):
+        self.sample_rate = sample_rate
+        self.route = route
+        if interval_ms is not None:
+            self.interval = interval_ms / 1000
+        # Flipped last so the middleware never sees half-applied settings
+        self.enabled = enabled
+
+    def settings(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "route": self.route,
+            "interval_ms": self.interval * 1000,
+            "buffer_size": self._profiles.maxlen,
+            "skipped_busy": self.skipped_busy,
+        }
+
+    def _route_for(self, scope) -> Optional[str]:
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", None)
+        return None
+
+    def start(self, scope) -> Optional[Profile]:
+        """Begin profiling the request if it is chosen, returning its profile."""
+        route = self._route_for(scope)
+        if self.route is not None and route != self.route:
+            return None
+        if random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            # One sampler at a time keeps the overhead bounded
+            if self._active is not None:
+                self.skipped_busy += 1
+                return None
+            profile = Profile(
+                next(self._ids), scope["method"], scope["path"], route, datetime.utcnow(), self.interval
+            )
+            self._active = _Sampler(self.interval)
+        self._active.start()
+        return profile
+
+    def finish(self, profile: Profile, status: int, duration: float):
+        sampler = self._active
+        sampler.stop()
+        profile.status = status
+        profile.duration = duration
+        profile.samples = sampler.samples
+        profile.stacks = sampler.stacks
+        with self._lock:
+            self._active = None
+            self._profiles.append(profile)
+
+    def profiles(self) -> list:
+        with self._lock:
+            return [p.summary() for p in reversed(self._profiles)]
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+profiler = RequestProfiler()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware handing chosen requests to :data:`profiler`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiler.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiler.start(scope)
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            profiler.finish(profile, status, time.perf_counter() - start)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 
 class ProductOut(BaseModel):
@@ -9,5 +9,6 @@ class ProductOut(BaseModel):
     price: str
     delivery_range_km: int
     image_urls: List[str]
+    image_variants: List[Optional[dict]] = []
 
     model_config = {"from_attributes": True}
@@ -0,0 +1,94 @@
+# search.py
+"""Full-text product search backed by Postgres tsvector or SQLite FTS5."""
+
+import logging
+import re
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration; "simple" avoids English stemming of Hindi names
+SEARCH_CONFIG = "simple"
+
+# The query must repeat the expression migration 6 indexes for the GIN index to be used
+_PG_DOCUMENT = (
+    f"to_tsvector('{SEARCH_CONFIG}', coalesce(name, '') || ' ' || coalesce(description, ''))"
+)
+_PG_QUERY_TERMS = f"plainto_tsquery('{SEARCH_CONFIG}', :q)"
+
+_COLUMNS = "id, name, description, price, image_url, delivery_range_km"
+
+# Like totals for the (at most one page of) matched rows
+_LIKES = 'coalesce((SELECT sum(l."like") FROM "like" l WHERE l.product_id = {table}.id), 0) AS likes'
+
+_PG_QUERY = f"""
+    SELECT {_COLUMNS}, {_LIKES.format(table="products")},
+           ts_rank({_PG_DOCUMENT}, {_PG_QUERY_TERMS}) AS rank
+    FROM products
+    WHERE is_validated AND {_PG_DOCUMENT} @@ {_PG_QUERY_TERMS}
+    ORDER BY rank DESC, id
+    LIMIT :limit OFFSET :offset
+"""
+
+_SQLITE_QUERY = f"""
+    SELECT p.id, p.name, p.description, p.price, p.image_url, p.delivery_range_km,
+           {_LIKES.format(table="p")}, -bm25(products_fts) AS rank
+    FROM products_fts JOIN products p ON p.id = products_fts.rowid
+    WHERE products_fts MATCH :q AND p.is_validated
+    ORDER BY bm25(products_fts), p.id
+    LIMIT :limit OFFSET :offset
+"""
+
+# Used when no full-text index is available; scans but keeps the API working
+_FALLBACK_QUERY = f"""
+    SELECT {_COLUMNS}, {_LIKES.format(table="products")}, 0 AS rank
+    FROM products
+    WHERE is_validated AND (lower(name) LIKE :pattern OR lower(description) LIKE :pattern)
+    ORDER BY id
+    LIMIT :limit OFFSET :offset
+"""
+
+_backend = "fallback"
+
+
+def setup_search(engine):
+    """Pick the search backend from the index the migrations created."""
+    global _backend
+    dialect = engine.dialect.name
+    with engine.connect() as conn:
+        if dialect == "postgresql":
+            found = conn.execute(
+                text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_products_search'")
+            ).first()
+        elif dialect == "sqlite":
+            found = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")
+            ).first()
+        else:
+            found = None
+    _backend = dialect if found else "fallback"
+    if not found:
+        logger.warning("Full-text index missing, product search uses the LIKE fallback")
+
+
+def _fts5_query(q: str) -> str:
+    """Quote each search term so user input is never parsed as FTS5 syntax."""
+    terms = re.findall(r"\w+", q)
+    return " ".join('"%s"*' % t for t in terms)
+
+
+def search_products(db, q: str, limit: int, offset: int):
+    """Return ranked rows of validated products matching ``q``."""
+    params = {"q": q, "limit": limit, "offset": offset}
+    if _backend == "postgresql":
+        sql = _PG_QUERY
+    elif _backend == "sqlite":
+        params["q"] = _fts5_query(q)
+        if not params["q"]:
+            return []
+        sql = _SQLITE_QUERY
+    else:
+        params["pattern"] = f"%{q.lower()}%"
+        sql = _FALLBACK_QUERY
+    return db.execute(text(sql), params).mappings().all()
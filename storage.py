@@ -0,0 +1,314 @@
+# storage.py
+"""Image storage backends and the bounded pool that uploads to them."""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+from uuid import uuid4
+
+import cloudinary.uploader
+from fastapi import UploadFile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it no variants are made
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Which backend stores product images: "cloudinary", "local" or "memory"
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "cloudinary")
+
+# Directory used by the local backend and the URL prefix it is served under
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "static/uploads"))
+MEDIA_URL_PREFIX = "/media/"
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+CHUNK_SIZE = 64 * 1024
+
+# Responsive sizes (longest edge in pixels) generated for every stored image
+IMAGE_VARIANTS = {"thumb": 160, "card": 480, "full": 1280}
+VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+VARIANT_WORKERS = int(os.getenv("VARIANT_WORKERS", "2"))
+
+_variant_pool = ThreadPoolExecutor(max_workers=VARIANT_WORKERS, thread_name_prefix="variants")
+
+# Names produced by LocalFileStorage; anything else is rejected when serving
+MEDIA_NAME_RE = re.compile(r"^[0-9a-f]{32}(_(thumb|card|full))?\.[a-z]+$")
+
+# Concurrent uploads across all requests, and seconds allowed per upload
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "30"))
+
+_upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+class UploadTimeout(Exception):
+    """Raised when a single image upload exceeds ``UPLOAD_TIMEOUT``."""
+
+
+class ImageStorage:
+    """Where product images are kept. ``save`` and ``delete`` run in worker threads."""
+
+    def save(self, fileobj: BinaryIO, filename: str, digest: str) -> str:
+        """Store the image read from ``fileobj`` and return its public URL.
+
+        ``digest`` is the SHA-256 of the content; backends name objects by
+        it so identical uploads map to the same object.
+        """
+        raise NotImplementedError
+
+    def delete(self, url: str):
+        """Remove a stored image once no product references it."""
+        raise NotImplementedError
+
+    def variants(self, url: str) -> Optional[dict]:
+        """Return resized URLs for ``url`` keyed by size then format, if any.
+
+        The shape is ``{"thumb": {"width": 160, "webp": ..., "jpeg": ...}, ...}``
+        so pages can build ``srcset`` attributes from it.
+        """
+        return None
+
+
+class CloudinaryStorage(ImageStorage):
+    FOLDER = "kinbech_uploads"
+
+    def save(self, fileobj: BinaryIO, filename: str, digest: str) -> str:
+        result = cloudinary.uploader.upload(
+            fileobj,
+            folder=self.FOLDER,  # Optional: Organize images
+            public_id=digest[:32],  # Content-addressed filename
+            resource_type="image",
+            timeout=UPLOAD_TIMEOUT,
+        )
+        return result["secure_url"]
+
+    def delete(self, url: str):
+        name = url.rsplit("/", 1)[-1].split(".", 1)[0]
+        cloudinary.uploader.destroy(f"{self.FOLDER}/{name}", resource_type="image")
+
+    def variants(self, url: str) -> Optional[dict]:
+        # Cloudinary resizes on the fly from transformation segments in the URL
+        if "/image/upload/" not in url:
+            return None
+        head, tail = url.split("/image/upload/", 1)
+        return {
+            size: {
+                "width": width,
+                **{
+                    fmt: f"{head}/image/upload/w_{width},c_limit,f_{'jpg' if fmt == 'jpeg' else fmt},q_auto/{tail}"
+                    for fmt in VARIANT_FORMATS
+                },
+            }
+            for size, width in IMAGE_VARIANTS.items()
+        }
+
+
+class MemoryStorage(ImageStorage):
+    """Keeps images in a dict; a stand-in for running and testing offline."""
+
+    def __init__(self):
+        self.files: Dict[str, bytes] = {}
+
+    def save(self, fileobj: BinaryIO, filename: str, digest: str) -> str:
+        key = f"{digest[:32]}{os.path.splitext(filename or '')[1]}"
+        self.files[key] = fileobj.read()
+        return f"memory://{key}"
+
+    def delete(self, url: str):
+        self.files.pop(url[len("memory://"):], None)
+
+
+class LocalFileStorage(ImageStorage):
+    """Writes images under ``UPLOAD_DIR`` named by the SHA-256 of their content.
+
+    The upload is copied to disk in chunks, so it is never held in memory
+    whole. Content-addressed names never change meaning, which lets
+    ``/media`` serve them with immutable cache headers.
+    """
+
+    def __init__(self, directory: Path = UPLOAD_DIR):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def save(self, fileobj: BinaryIO, filename: str, digest: str) -> str:
+        ext = os.path.splitext(filename or "")[1].lower()
+        if ext not in IMAGE_EXTENSIONS:
+            ext = ".jpg"
+        name = f"{digest[:32]}{ext}"
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    out.write(chunk)
+            os.replace(tmp_path, self.directory / name)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if Image is not None and not self._variants_ready(name):
+            future = _variant_pool.submit(make_variants, self.directory / name)
+            future.add_done_callback(_log_variant_failure)
+        return f"{MEDIA_URL_PREFIX}{name}"
+
+    def delete(self, url: str):
+        if not url.startswith(MEDIA_URL_PREFIX):
+            return
+        name = url[len(MEDIA_URL_PREFIX):]
+        paths = [self.directory / name] + [
+            self._variant_path(name, size, fmt)
+            for size in IMAGE_VARIANTS
+            for fmt in VARIANT_FORMATS
+        ]
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _variant_path(self, name: str, size: str, fmt: str) -> Path:
+        stem = name.split(".", 1)[0]
+        return self.directory / f"{stem}_{size}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+    def _variants_ready(self, name: str) -> bool:
+        # make_variants writes this file last, so it marks a complete set
+        return self._variant_path(name, "full", "jpeg").is_file()
+
+    def variants(self, url: str) -> Optional[dict]:
+        if not url.startswith(MEDIA_URL_PREFIX):
+            return None
+        name = url[len(MEDIA_URL_PREFIX):]
+        if not self._variants_ready(name):
+            return None
+        return {
+            size: {
+                "width": width,
+                **{
+                    fmt: f"{MEDIA_URL_PREFIX}{self._variant_path(name, size, fmt).name}"
+                    for fmt in VARIANT_FORMATS
+                },
+            }
+            for size, width in IMAGE_VARIANTS.items()
+        }
+
+    def path_for(self, name: str) -> Optional[Path]:
+        """Return the file for a ``/media`` name, or None if it is not ours."""
+        if not MEDIA_NAME_RE.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+
+def make_variants(path: Path):
+    """Write every size/format variant of the image at ``path`` beside it."""
+    stem = path.name.split(".", 1)[0]
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    # "full" is written last so its JPEG marks the whole set as ready
+    for size, width in IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((width, width))
+        for fmt, pil_format in VARIANT_FORMATS.items():
+            target = path.with_name(f"{stem}_{size}.{'jpg' if fmt == 'jpeg' else fmt}")
+            tmp = target.with_name(f"{target.name}.{uuid4().hex}.part")
+            resized.save(tmp, pil_format, quality=80)
+            os.replace(tmp, target)
+
+
+def _log_variant_failure(future):
+    if future.exception() is not None:
+        logger.error("Failed to create image variants: %s", future.exception())
+
+
+def _create_storage() -> ImageStorage:
+    if IMAGE_STORAGE == "memory":
+        return MemoryStorage()
+    if IMAGE_STORAGE == "local":
+        return LocalFileStorage()
+    return CloudinaryStorage()
+
+
+image_storage = _create_storage()
+
+
+def _hash_file(fileobj: BinaryIO) -> str:
+    """Return the SHA-256 of ``fileobj`` read in chunks, then rewind it."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+async def hash_images(images: List[UploadFile]) -> List[str]:
+    """Hash every upload on the pool so duplicates are found before uploading."""
+    loop = asyncio.get_running_loop()
+    return list(
+        await asyncio.gather(
+            *(loop.run_in_executor(_upload_pool, _hash_file, image.file) for image in images)
+        )
+    )
+
+
+def _set_once(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def _upload_one(image: UploadFile, digest: str) -> str:
+    loop = asyncio.get_running_loop()
+    picked_up = loop.create_future()
+
+    def save():
+        loop.call_soon_threadsafe(_set_once, picked_up)
+        return image_storage.save(image.file, image.filename, digest)
+
+    future = loop.run_in_executor(_upload_pool, save)
+    # Time spent waiting for a free worker does not count towards the timeout
+    await asyncio.wait([future, picked_up], return_when=asyncio.FIRST_COMPLETED)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), UPLOAD_TIMEOUT)
+    except asyncio.TimeoutError:
+        # The worker cannot be interrupted; remove what it stores once it is done
+        future.add_done_callback(_delete_late_upload)
+        raise UploadTimeout(f"Upload of {image.filename!r} timed out")
+
+
+def _delete_late_upload(future):
+    if not future.cancelled() and future.exception() is None:
+        delete_images([future.result()])
+
+
+async def upload_images(images: List[UploadFile], digests: List[str]) -> List[str]:
+    """Upload all images in parallel on the bounded pool, keeping their order.
+
+    If any upload fails, the ones that succeeded are deleted again before
+    the first error is raised, since no product will reference them.
+    """
+    results = await asyncio.gather(
+        *(_upload_one(image, digest) for image, digest in zip(images, digests)),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        delete_images([r for r in results if not isinstance(r, BaseException)])
+        raise errors[0]
+    return results
+
+
+def delete_images(urls: List[str]):
+    """Remove unreferenced images in the background, logging any failure."""
+    for url in urls:
+        future = _upload_pool.submit(image_storage.delete, url)
+        future.add_done_callback(_log_delete_failure)
+
+
+def _log_delete_failure(future):
+    if future.exception() is not None:
+        logger.error("Failed to delete stored image: %s", future.exception())